@@ -318,7 +318,7 @@ def main() -> int:
     run_script(SCRIPT_1B)
 
     # Summary
-    c1a = len(list(STAGING_1A.glob("*.json"))) if STAGING_1A.exists() else 0
+    c1a = len([p for p in STAGING_1A.glob("*.json*") if p.suffix in (".json", ".jsonl")]) if STAGING_1A.exists() else 0
     c1b = len(list(STAGING_1B.glob("*.json"))) if STAGING_1B.exists() else 0
     summary = (
         "Step summary:\n"
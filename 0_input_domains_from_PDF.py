@@ -1,23 +1,61 @@
+import os
 import re
+import time
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
 import fitz  # PyMuPDF
 import requests
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Set, Tuple
 from datetime import date
 
-# === Load IANA TLDs ===
+# Atomic groups need the third-party `regex` module or Python 3.11+'s re.
+try:
+    import regex as re_engine
+except ImportError:
+    re_engine = re
+
+# === Load IANA TLDs (cached on disk, refreshed weekly) ===
 tld_url = "https://data.iana.org/TLD/tlds-alpha-by-domain.txt"
-tld_response = requests.get(tld_url, timeout=30)
-tld_response.raise_for_status()
-tlds = {
+# Kept out of .\input so it is never mistaken for the newest domain list.
+TLD_CACHE = Path("./staging/.iana_tlds.txt")
+TLD_CACHE_MAX_AGE = 7 * 24 * 60 * 60
+
+def load_tld_text() -> str:
+    """IANA TLD list from the local cache; download only when missing/stale, fall back to stale cache if offline."""
+    if TLD_CACHE.exists() and time.time() - TLD_CACHE.stat().st_mtime < TLD_CACHE_MAX_AGE:
+        return TLD_CACHE.read_text(encoding="utf-8")
+    try:
+        tld_response = requests.get(tld_url, timeout=30)
+        tld_response.raise_for_status()
+    except requests.RequestException as e:
+        if TLD_CACHE.exists():
+            print(f"[WARN] TLD download failed ({e}); using cached copy: {TLD_CACHE}")
+            return TLD_CACHE.read_text(encoding="utf-8")
+        raise
+    TLD_CACHE.parent.mkdir(parents=True, exist_ok=True)
+    TLD_CACHE.write_text(tld_response.text, encoding="utf-8")
+    return tld_response.text
+
+tlds = frozenset(
     line.strip().lower()
-    for line in tld_response.text.splitlines()
+    for line in load_tld_text().splitlines()
     if line and not line.startswith("#")
-}
+)
 
 # === Regex Patterns ===
-email_pattern = re.compile(r"\b[\w.-]+@[\w.-]+\.[a-z]{2,}\b", re.IGNORECASE)
-domain_candidate_pattern = re.compile(r"\b((?:[\w-]+\.)+([a-z]{2,}))\b", re.IGNORECASE)
+# One pass over the page text; candidates must start at a word boundary, like the old per-token .match().
+# Only real TLDs are accepted; longest alternatives first so e.g. ".museum" wins over ".mu".
+tld_alt = "|".join(sorted(map(re.escape, tlds), key=len, reverse=True))
+email_pattern = r"(?P<email>[\w.-]+@[\w.-]+\.[a-z]{2,})\b"
+# Each "label." is atomic, so long dotted junk cannot make the engine retry every label split.
+# The TLD must be the final label: the lookahead stops "name.gov.invalid" or "report.nl.pdf"
+# from backtracking to a shorter prefix that happens to end in a real TLD.
+domain_candidate_pattern = rf"(?P<dom>(?:(?>[\w-]+)\.)+(?P<tld>{tld_alt}))(?![\w-]|\.[\w-])"
+candidate_pattern = re_engine.compile(rf"(?<!\S)\b(?:{email_pattern}|{domain_candidate_pattern})", re_engine.IGNORECASE)
+
+# Below this many pages per worker, process start-up costs more than it saves.
+MIN_PAGES_PER_WORKER = 8
 
 def clean_domain(domain_str: str) -> str:
     """Normalize a domain string (lowercase, trim punctuation, strip leading www.)."""
@@ -38,34 +76,89 @@ def page_text(page) -> str:
         return page.getText("text")  # type: ignore[attr-defined]
     raise AttributeError("PyMuPDF Page has no get_text/getText method")
 
-def extract_domains(pdf_path: str | Path) -> Tuple[List[str], List[str], List[str]]:
-    found_all: List[str] = []
-    found_email_verified: List[str] = []
-    found_web_verified: List[str] = []
-
-    doc = fitz.open(str(pdf_path))
-    for page in doc:
-        text = page_text(page).replace("-\n", "").replace("\n", " ").strip(" \t\r\n.,;:")
-        words = text.split()
+def page_words(page) -> List[str]:
+    """Word tokens straight from the PyMuPDF parser, re-joining words hyphenated across a line break."""
+    if hasattr(page, "get_text"):
+        raw = page.get_text("words")
+    elif hasattr(page, "getTextWords"):  # older PyMuPDF
+        raw = page.getTextWords()  # type: ignore[attr-defined]
+    else:
+        return page_text(page).replace("-\n", "").split()
+
+    # word tuple: (x0, y0, x1, y1, word, block_no, line_no, word_no)
+    words: List[str] = []
+    prev_line = None
+    for w in raw:
+        token, line = w[4], (w[5], w[6])
+        if words and line != prev_line and words[-1].endswith("-"):
+            words[-1] = words[-1][:-1] + token
+        else:
+            words.append(token)
+        prev_line = line
+    return words
+
+def extract_page_range(pdf_path: str, start: int, stop: int) -> Tuple[Set[str], Set[str], Set[str]]:
+    """Scan pages [start, stop) of the PDF. Opens its own document so it can run in a worker process."""
+    found_all: Set[str] = set()
+    found_email_verified: Set[str] = set()
+    found_web_verified: Set[str] = set()
+
+    doc = fitz.open(pdf_path)
+    for page_no in range(start, stop):
+        words = page_words(doc[page_no])
+        text = " ".join(words)
+        word_starts: List[int] = []
+        pos = 0
+        for w in words:
+            word_starts.append(pos)
+            pos += len(w) + 1
+
+        for m in candidate_pattern.finditer(text):
+            i = bisect_right(word_starts, m.start()) - 1
 
-        for i, token in enumerate(words):
             # Email check
-            if email_pattern.match(token):
-                dom_part = token.split("@", 1)[1]
+            if m.group("email"):
+                dom_part = m.group("email").split("@", 1)[1]
                 dom_clean = clean_domain(dom_part)
-                found_all.append(dom_clean)
+                found_all.add(dom_clean)
                 if verify_context(words, i, "e-mail"):
-                    found_email_verified.append(dom_clean)
-
-            # Domain check
-            match = domain_candidate_pattern.match(token)
-            if match:
-                full_dom, tld = match.groups()
-                if tld.lower() in tlds:
-                    dom_clean = clean_domain(full_dom)
-                    found_all.append(dom_clean)
-                    if verify_context(words, i, "website"):
-                        found_web_verified.append(dom_clean)
+                    found_email_verified.add(dom_clean)
+                continue
+
+            # Domain check (TLD already validated by the pattern)
+            dom_clean = clean_domain(m.group("dom"))
+            found_all.add(dom_clean)
+            if verify_context(words, i, "website"):
+                found_web_verified.add(dom_clean)
+    doc.close()
+
+    return found_all, found_email_verified, found_web_verified
+
+
+def extract_domains(pdf_path: str | Path) -> Tuple[Set[str], Set[str], Set[str]]:
+    # fitz.Document is not thread-safe, so pages are split into contiguous ranges
+    # and each range is opened and scanned in its own process.
+    pdf_path = str(pdf_path)
+    doc = fitz.open(pdf_path)
+    page_count = len(doc)
+    doc.close()
+
+    workers = min(os.cpu_count() or 1, -(-page_count // MIN_PAGES_PER_WORKER))
+    if workers <= 1:
+        return extract_page_range(pdf_path, 0, page_count)
+
+    step = -(-page_count // workers)
+    starts = list(range(0, page_count, step))
+    stops = [min(s + step, page_count) for s in starts]
+
+    found_all: Set[str] = set()
+    found_email_verified: Set[str] = set()
+    found_web_verified: Set[str] = set()
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        for part_all, part_email, part_web in ex.map(extract_page_range, [pdf_path] * len(starts), starts, stops):
+            found_all |= part_all
+            found_email_verified |= part_email
+            found_web_verified |= part_web
 
     return found_all, found_email_verified, found_web_verified
 
@@ -73,15 +166,16 @@ def extract_domains(pdf_path: str | Path) -> Tuple[List[str], List[str], List[st
 def main() -> None:
     # === Run: pick most recent PDF in .\input ===
     input_dir = Path("./input")
-    pdf_files = list(input_dir.glob("*.pdf"))
+    with os.scandir(input_dir) as it:
+        pdf_files = [e for e in it if e.name.endswith(".pdf") and e.is_file()]
     if not pdf_files:
         raise FileNotFoundError(f"No PDF files found in: {input_dir.resolve()}")
 
-    pdf_file = max(pdf_files, key=lambda p: p.stat().st_mtime)
+    pdf_file = Path(max(pdf_files, key=lambda e: e.stat().st_mtime).path)
     all_found, email_verified, web_verified = extract_domains(pdf_file)
 
-    # Combine verified lists and deduplicate
-    combined_verified = sorted(set(email_verified + web_verified))
+    # Combine verified sets
+    combined_verified = sorted(email_verified | web_verified)
 
     # === Output ===
     staging_dir = Path("./input")
@@ -90,13 +184,11 @@ def main() -> None:
     today_str = date.today().strftime("%Y%m%d")
     out_domains_path = staging_dir / f"cpss_scan_domains_{today_str}.txt"
 
-    with out_domains_path.open("w", encoding="utf-8") as f:
-        for d in combined_verified:
-            f.write(d + "\n")
+    out_domains_path.write_text("\n".join(combined_verified) + ("\n" if combined_verified else ""), encoding="utf-8")
 
     # === Print stats ===
-    print(f"Verified email domains: {len(set(email_verified))}")
-    print(f"Verified website domains: {len(set(web_verified))}")
+    print(f"Verified email domains: {len(email_verified)}")
+    print(f"Verified website domains: {len(web_verified)}")
     print(f"Combined unique verified domains: {len(combined_verified)}")
     print(f"Domains output written to: {out_domains_path}")
 
@@ -1,7 +1,18 @@
 import requests
+from requests.adapters import HTTPAdapter
 from pathlib import Path
-import json, time, os, csv
+import json, time, os, re, csv, random, threading, atexit
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import chain
 from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# Optional fast JSON backend; the stdlib json module is used when orjson is missing.
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 # === FOLDER STRUCTURE ===
 INPUT_DIR = Path("./input")
@@ -14,10 +25,14 @@ API_URL = "https://api.magnify.modat.io/host/search/v1"
 API_KEY_FILE = Path("./input/api_keys/modat_api_key.txt")
 STRICT_SUFFIX_MATCH = True
 PAGE_SIZE = 100
-MAX_RETRIES = 3
-SLEEP_BETWEEN_COMPANIES = 3.2
-SLEEP_AFTER_BATCH = 30
-BATCH_SIZE = 10
+MAX_RETRIES = 5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 2.0          # seconds, doubled each attempt
+BACKOFF_MAX = 60.0
+# Modat publishes no request quota, so the limiter keeps the original script's average pace:
+# ~3.2 s between companies plus a 30 s pause after every 10 (10 requests per ~62 s).
+MAX_WORKERS = 2             # companies queried concurrently (overlaps one request with the next wait)
+REQUESTS_PER_SECOND = 10 / 62.0   # shared budget across all workers
 
 # === PREPARE OUTPUT ===
 os.makedirs(OUTPUT_DIR, exist_ok=True)
@@ -26,25 +41,79 @@ timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H-%M-%S")
 LOG_FILE = os.path.join(LOG_DIR, f"modat_host_api_log_{timestamp}.csv")
 
 # === LOGGING HELPERS ===
+# The log file stays open for the whole run; rows are buffered and written in batches.
+LOG_FLUSH_EVERY = 32        # rows
+LOG_FLUSH_SECONDS = 5.0
+LOG_FH = None
+LOG_WRITER = None
+LOG_BUFFER: list[list] = []
+LOG_LAST_FLUSH = time.monotonic()
+
+def _ts() -> str:
+    """UTC log timestamp (ISO-8601, second precision) without building a datetime per row."""
+    return time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime())
+
 def init_log_file():
+    global LOG_FH, LOG_WRITER
     need_header = not os.path.exists(LOG_FILE) or os.path.getsize(LOG_FILE) == 0
-    with open(LOG_FILE, 'a', newline='', encoding='utf-8') as logf:
-        writer = csv.writer(logf)
-        if need_header:
-            writer.writerow(['company', 'status', 'results', 'timestamp'])
+    LOG_FH = open(LOG_FILE, 'a', newline='', encoding='utf-8', buffering=1 << 16)
+    LOG_WRITER = csv.writer(LOG_FH)
+    if need_header:
+        LOG_WRITER.writerow(['company', 'status', 'results', 'timestamp'])
+    atexit.register(close_log_file)
+
+def flush_log():
+    global LOG_LAST_FLUSH
+    if LOG_BUFFER:
+        LOG_WRITER.writerows(LOG_BUFFER)
+        LOG_BUFFER.clear()
+    LOG_FH.flush()
+    LOG_LAST_FLUSH = time.monotonic()
+
+def close_log_file():
+    if LOG_FH is not None and not LOG_FH.closed:
+        flush_log()
+        LOG_FH.close()
 
 def append_log_row(company, status, count):
-    with open(LOG_FILE, 'a', newline='', encoding='utf-8') as logf:
-        writer = csv.writer(logf)
-        writer.writerow([company, status, count, datetime.now(timezone.utc).isoformat()])
+    LOG_BUFFER.append([company, status, count, _ts()])
+    if len(LOG_BUFFER) >= LOG_FLUSH_EVERY or time.monotonic() - LOG_LAST_FLUSH >= LOG_FLUSH_SECONDS:
+        flush_log()
+
+
+# === RATE LIMITER (shared by all worker threads) ===
+class RateLimiter:
+    """Thread-safe token bucket: at most `rate` requests per `per` seconds."""
+
+    def __init__(self, rate: float, per: float = 1.0):
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.fill_rate = rate / per
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.fill_rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+LIMITER = RateLimiter(REQUESTS_PER_SECOND)
 
 
 # === INPUT MOST RECENT .txt FROM .\input ===
 def newest_txt_in_input(input_dir: Path) -> Path:
-    txts = [p for p in input_dir.glob("*.txt") if p.is_file()]
+    with os.scandir(input_dir) as it:
+        txts = [e for e in it if e.name.endswith(".txt") and e.is_file()]
     if not txts:
         raise FileNotFoundError(f"No .txt files found in '{input_dir.resolve()}'")
-    return max(txts, key=lambda p: p.stat().st_mtime)
+    return Path(max(txts, key=lambda e: e.stat().st_mtime).path)
 
 COMPANY_LIST_FILE = newest_txt_in_input(INPUT_DIR)
 print(f"[INFO] Using newest input list: '{COMPANY_LIST_FILE}'")
@@ -63,40 +132,84 @@ if API_KEY_FILE.exists():
 else:
     raise FileNotFoundError(f"API key file not found: '{API_KEY_FILE}'")
 
+# === HTTP SESSION (keep-alive, pooled connections shared by all workers) ===
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=0))
+SESSION.headers.update(headers)
+
 # === LOAD MOST RECENT .txt FROM .\input ===
 with open(COMPANY_LIST_FILE, "r", encoding="utf-8") as f:
     companies = sorted(set([line.strip() for line in f if line.strip()]))
 
 
 # === HELPER TO RESCAN FROM LAST COMPANY WHEN INTERRUPTED ===
+# modat_host_<safe_name>_<YYYYMMDD>.jsonl (.json from older runs)
+_FN_RX = re.compile(r"^modat_host_(?P<name>.+)_(?P<date>\d{8})\.jsonl?$")
+
 def load_completed_safe_names() -> set[str]:
     completed = set()
     if not OUTPUT_DIR.exists():
         return completed
 
-    for f in OUTPUT_DIR.glob("modat_host_*_*.json"):
-        stem = f.stem
-        parts = stem.split("_")
-        if len(parts) >= 4:
-            safe_name_parts = parts[2:-1]
-            safe_name = "_".join(safe_name_parts).lower()
-            completed.add(safe_name)
+    match = _FN_RX.match
+    with os.scandir(OUTPUT_DIR) as it:
+        for entry in it:
+            m = match(entry.name)
+            if m:
+                completed.add(m["name"].lower())
     return completed
 
 COMPLETED_SAFE_NAMES = load_completed_safe_names()
 print(f"[INFO] Found {len(COMPLETED_SAFE_NAMES)} already processed companies in '{OUTPUT_DIR}'.")
 
 
+# === RETRY / BACKOFF ===
+def _server_wait_hint(resp_headers) -> float:
+    """Seconds the server asked us to wait (Retry-After / X-RateLimit-Reset), or 0."""
+    retry_after = resp_headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    reset = resp_headers.get("X-RateLimit-Reset")
+    if reset:
+        try:
+            v = float(reset)
+        except ValueError:
+            return 0.0
+        # epoch timestamp vs. delta-seconds
+        return max(0.0, v - time.time()) if v > 1e9 else max(0.0, v)
+    return 0.0
+
+def backoff(attempt: int, resp=None) -> float:
+    """Exponential backoff with jitter, never shorter than what the server asked for."""
+    wait = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+    if resp is not None:
+        wait = max(wait, _server_wait_hint(resp.headers))
+    return wait
+
+
 # === FUNCTION TO FETCH A PAGE WITH RETRIES ===
 def fetch_page(q, page_num):
     payload = {"query": q, "page": page_num, "page_size": PAGE_SIZE}
     for attempt in range(1, MAX_RETRIES + 1):
-        response = requests.post(API_URL, json=payload, headers=headers)
+        LIMITER.acquire()
+        try:
+            response = SESSION.post(API_URL, json=payload, timeout=60)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            wait_time = backoff(attempt)
+            print(f"Network error ({e.__class__.__name__}), retry {attempt}/{MAX_RETRIES} after {wait_time:.1f}s...")
+            time.sleep(wait_time)
+            continue
         if response.status_code == 200:
             return response.json()
-        elif response.status_code == 429:
-            wait_time = 5 * attempt
-            print(f"Rate limit hit (429), retry {attempt}/{MAX_RETRIES} after {wait_time}s...")
+        elif response.status_code in RETRY_STATUSES:
+            wait_time = backoff(attempt, response)
+            print(f"HTTP {response.status_code}, retry {attempt}/{MAX_RETRIES} after {wait_time:.1f}s...")
             time.sleep(wait_time)
         else:
             print(f"HTTP {response.status_code}: {response.text}")
@@ -110,10 +223,10 @@ def extract_results(response_data):
 
 
 # === STRICT SUFFIX MATCH HELPERS ===
-def _under(h, base):
-    if not isinstance(h, str): return False
-    h = h.lower().strip("."); base = base.lower().strip(".")
-    return h == base or h.endswith("." + base)
+def _suffix_matcher(base: str):
+    """Compiled search for `base` itself or any subdomain of it (input must be lower-cased)."""
+    # \Z, not $: "$" would also match before a trailing newline, which endswith() never accepted
+    return re.compile(rf"(?:^|\.){re.escape(base.lower().strip('.'))}\Z").search
 
 def _host_from(item: dict) -> str:
     for k in ("host", "hostname", "fqdn", "domain", "name"):
@@ -162,79 +275,128 @@ def _fqdns_from(item: dict) -> list[str]:
     return out
 
 
+# IP fields step 2 (extract_ipv4s_from_modat_host_json) reads, top level and under "host"
+_IP_KEYS = ("ip", "ip_str", "ip_address", "addr", "address")
 
-# === MAIN LOOP ===
-init_log_file()
-log_entries = []
-scan_count = 0
+def _dedupe_key(item: dict) -> tuple | None:
+    """(host, IPs, port) identity of a record, or None when it has none of them (never deduplicated)."""
+    ips = [item.get(k) for k in _IP_KEYS if item.get(k)]
+    host = item.get("host")
+    if isinstance(host, dict):
+        ips.extend(host.get(k) for k in _IP_KEYS if host.get(k))
+    interfaces = item.get("interfaces")
+    if isinstance(interfaces, list):
+        ips.extend(i.get("ip") for i in interfaces if isinstance(i, dict) and i.get("ip"))
+    name, port = _host_from(item), item.get("port")
+    if not name and not ips and port is None:
+        return None
+    # repr: values may be unhashable (lists/dicts) in odd records
+    return name, repr(ips), repr(port)
 
-for idx, company in enumerate(companies):
-    if scan_count > 0 and scan_count % BATCH_SIZE == 0:
-        print(f"Batch limit reached ({BATCH_SIZE}). Sleeping {SLEEP_AFTER_BATCH} seconds...")
-        time.sleep(SLEEP_AFTER_BATCH)
+def _norm_names(item: dict):
+    """Host, SANs and FQDNs of a record, stripped of dots and lower-cased once."""
+    for name in chain((_host_from(item),), _sans_from(item), _fqdns_from(item)):
+        if name:
+            yield name.strip(".").lower()
 
-    company = company.strip()
-    if not company:
-        continue
 
-    company_lower = company.lower()
-    safe_name = company_lower.replace(" ", "_").replace("/", "_")
 
-    if safe_name in COMPLETED_SAFE_NAMES:
-        print(f"[SKIP] {company} (safe_name='{safe_name}') already processed in '{OUTPUT_DIR}'.")
-        append_log_row(company, "SKIP_EXISTS", 0)
-        continue
+# === JSONL OUTPUT (one record per line, appended as pages arrive) ===
+def jsonl_line(obj) -> bytes:
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj) + b"\n"
+    return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
 
+
+# === PER-COMPANY SCAN (runs in worker threads) ===
+def scan_company(company: str) -> tuple[str, str, int]:
+    company_lower = company.lower()
     query = f"(web.html ~ {company_lower}) OR (cert ~ {company_lower}) OR (domain ~ {company_lower})"
     print(f"\n Querying {company}...")
 
     response_data = fetch_page(query, 1)
     if not response_data:
-        log_entries.append([company, "FAIL", 0, timestamp])
-        continue
+        return company, "FAIL", 0
 
     total_pages = response_data.get("total_pages", 1)
     total_records = response_data.get("total_records", 0)
-    results = extract_results(response_data)
-    all_results = results.copy()
-
-    print(f"Fetched page 1 of {total_pages}, {len(results)} results (total: {total_records})")
 
-    for page_num in range(2, total_pages + 1):
-        time.sleep(3.1)
-        page_data = fetch_page(query, page_num)
-        if not page_data:
-            print(f"Failed to fetch page {page_num}")
-            break
-        results = extract_results(page_data)
-        all_results.extend(results)
-        print(f"Fetched page {page_num} of {total_pages}, {len(results)} results")
-
-
-    # === FILTER RESULTS (strict suffix match) ===
-    if STRICT_SUFFIX_MATCH:
-        filtered = []
-        for it in all_results:
-            h = _host_from(it)
-            sans = _sans_from(it)
-            fqdns = _fqdns_from(it)
-            if _under(h, company_lower) or any(_under(s, company_lower) for s in sans) or any(_under(f, company_lower) for f in fqdns):
-                filtered.append(it)
-        if len(filtered) != len(all_results):
-            print(f"[FILTER] removed {len(all_results) - len(filtered)} outside *.{company_lower}")
-        all_results = filtered
-
-
-    # === SAVE RESULTS ===
-    scan_count += 1
     date_str = datetime.now(timezone.utc).strftime("%Y%m%d")
     safe_name = company_lower.replace(" ", "_").replace("/", "_")
-    output_file = os.path.join(OUTPUT_DIR, f"modat_host_{safe_name}_{date_str}.json")
-    with open(output_file, "w", encoding="utf-8") as f_out:
-        json.dump({"results": all_results}, f_out, indent=2)
+    output_file = os.path.join(OUTPUT_DIR, f"modat_host_{safe_name}_{date_str}.jsonl")
+    # Written under .tmp and renamed when done, so resume never sees a half-written company
+    tmp_file = f"{output_file}.tmp"
+
+    under = _suffix_matcher(company_lower) if STRICT_SUFFIX_MATCH else None
+    # Hosts repeat across pages; keep only the first record per (host, IPs, port), see _dedupe_key
+    seen = set()
+    kept = 0
+    removed = 0
+
+    with open(tmp_file, "wb") as f_out:
+
+        def write_page(page_results):
+            nonlocal kept, removed
+            for it in page_results:
+                k = _dedupe_key(it)
+                if k is not None:
+                    if k in seen:
+                        continue
+                    seen.add(k)
+                # Strict suffix match
+                if under is not None and not any(under(n) for n in _norm_names(it)):
+                    removed += 1
+                    continue
+                f_out.write(jsonl_line(it))
+                kept += 1
+
+        results = extract_results(response_data)
+        write_page(results)
+        print(f"[{company}] Fetched page 1 of {total_pages}, {len(results)} results (total: {total_records})")
+
+        for page_num in range(2, total_pages + 1):
+            page_data = fetch_page(query, page_num)
+            if not page_data:
+                print(f"[{company}] Failed to fetch page {page_num}")
+                break
+            results = extract_results(page_data)
+            write_page(results)
+            print(f"[{company}] Fetched page {page_num} of {total_pages}, {len(results)} results")
+
+    os.replace(tmp_file, output_file)
+
+    if removed:
+        print(f"[FILTER] removed {removed} outside *.{company_lower}")
+    print(f"Saved {kept} results to '{output_file}'")
+    return company, "OK", kept
 
-    print(f"Saved {len(all_results)} results to '{output_file}'")
-    append_log_row(company, "OK", len(all_results))
-    time.sleep(SLEEP_BETWEEN_COMPANIES)
 
+# === MAIN LOOP ===
+# Workers only fetch and save; the log CSV is written from this (main) thread only.
+init_log_file()
+to_scan = []
+
+for company in companies:
+    company = company.strip()
+    if not company:
+        continue
+
+    safe_name = company.lower().replace(" ", "_").replace("/", "_")
+    if safe_name in COMPLETED_SAFE_NAMES:
+        print(f"[SKIP] {company} (safe_name='{safe_name}') already processed in '{OUTPUT_DIR}'.")
+        append_log_row(company, "SKIP_EXISTS", 0)
+        continue
+    to_scan.append(company)
+
+with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+    futures = {pool.submit(scan_company, company): company for company in to_scan}
+    for fut in as_completed(futures):
+        try:
+            company, status, count = fut.result()
+        except Exception as e:
+            company, status, count = futures[fut], "ERROR", 0
+            print(f"Error for {company}: {e}")
+        append_log_row(company, status, count)
+
+close_log_file()
 print(f"Logging to '{LOG_FILE}' (appended per company).")
@@ -1,8 +1,18 @@
 from pathlib import Path
-import requests, json, time, ipaddress
-from datetime import datetime
+import requests, json, os, time, ipaddress, threading, random
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
 from typing import Dict, List, Any
 
+# Optional fast JSON backend; the stdlib json module is used when orjson is missing.
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
 # === CONFIGURATION ===
 today = datetime.now().strftime("%Y%m%d")
 INPUT_DIR = Path("./input")
@@ -16,10 +26,11 @@ log_file = LOG_DIR / f"networksdb_log_{today}.csv"
 
 # === INPUT MOST RECENT .txt FROM .\input ===
 def newest_txt_in_input(input_dir: Path) -> Path:
-    txts = [p for p in input_dir.glob("*.txt") if p.is_file()]
+    with os.scandir(input_dir) as it:
+        txts = [e for e in it if e.name.endswith(".txt") and e.is_file()]
     if not txts:
         raise FileNotFoundError(f"No .txt files found in '{input_dir.resolve()}'")
-    return max(txts, key=lambda p: p.stat().st_mtime)
+    return Path(max(txts, key=lambda e: e.stat().st_mtime).path)
 
 input_file = newest_txt_in_input(INPUT_DIR)
 print(f"[INFO] Using newest input list: '{input_file}'")
@@ -32,7 +43,45 @@ with api_key_path.open("r") as f:
     api_key = f.read().strip()
 
 headers = {"X-Api-Key": api_key}
-delay_seconds = 1.5
+
+# === HTTP SESSION (keep-alive, pooled connections shared by all workers) ===
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=0))
+SESSION.headers.update(headers)
+
+# NetworksDB documents no per-second quota; keep the original 1.5 s between requests
+MAX_WORKERS = 2             # ip-info lookups in flight per domain
+REQUESTS_PER_SECOND = 1 / 1.5   # shared budget across all workers
+MAX_RETRIES = 5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 2.0          # seconds, doubled each attempt
+BACKOFF_MAX = 60.0
+
+
+# === RATE LIMITER (shared by all worker threads) ===
+class RateLimiter:
+    """Thread-safe token bucket: at most `rate` requests per `per` seconds."""
+
+    def __init__(self, rate: float, per: float = 1.0):
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.fill_rate = rate / per
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.fill_rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+LIMITER = RateLimiter(REQUESTS_PER_SECOND)
 
 # Load domains
 with input_file.open("r", encoding="utf-8") as f:
@@ -82,8 +131,85 @@ def _normalize_ip(ip_info: Dict[str, Any]) -> Dict[str, Any]:
 
     return out
 
+
+# === JSON OUTPUT ===
+def write_json(path, obj) -> None:
+    """Write to <path>.tmp and rename, so an interrupted run never leaves a truncated .json behind."""
+    tmp = f"{path}.tmp"
+    if ORJSON_AVAILABLE:
+        with open(tmp, "wb") as f_out:
+            f_out.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+    else:
+        with open(tmp, "w", encoding="utf-8") as f_out:
+            json.dump(obj, f_out, indent=2)
+    os.replace(tmp, path)
+
+
+# === RETRY / BACKOFF ===
+def _server_wait_hint(resp_headers) -> float:
+    """Seconds the server asked us to wait (Retry-After / X-RateLimit-Reset), or 0."""
+    retry_after = resp_headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    reset = resp_headers.get("X-RateLimit-Reset")
+    if reset:
+        try:
+            v = float(reset)
+        except ValueError:
+            return 0.0
+        # epoch timestamp vs. delta-seconds
+        return max(0.0, v - time.time()) if v > 1e9 else max(0.0, v)
+    return 0.0
+
+def backoff(attempt: int, resp=None) -> float:
+    """Exponential backoff with jitter, never shorter than what the server asked for."""
+    wait = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+    if resp is not None:
+        wait = max(wait, _server_wait_hint(resp.headers))
+    return wait
+
+def api_request(method: str, url: str, **kwargs) -> requests.Response:
+    """
+    One NetworksDB call through the rate limiter. 429/5xx and network errors are retried; the last
+    response is returned (or the last network error raised) so raise_for_status() still reports it.
+    """
+    for attempt in range(1, MAX_RETRIES + 1):
+        LIMITER.acquire()
+        try:
+            resp = SESSION.request(method, url, timeout=30, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt == MAX_RETRIES:
+                raise
+            wait = backoff(attempt)
+            print(f"[NET] {e.__class__.__name__} → retry {attempt}/{MAX_RETRIES} in {wait:.1f}s...")
+            time.sleep(wait)
+            continue
+        if resp.status_code in RETRY_STATUSES and attempt < MAX_RETRIES:
+            wait = backoff(attempt, resp)
+            print(f"[{resp.status_code}] retry {attempt}/{MAX_RETRIES} in {wait:.1f}s...")
+            time.sleep(wait)
+            continue
+        return resp
+
+
+# === HELPER: /api/ip-info lookup (runs in worker threads) ===
+def fetch_ip_info(ip: str) -> Dict[str, Any]:
+    ip_resp = api_request("POST", "https://networksdb.io/api/ip-info", data={"ip": ip})
+    ip_resp.raise_for_status()
+    return {"ip": ip, "ip_info": ip_resp.json()}
+
+def _ts() -> str:
+    """Local log timestamp (ISO-8601, second precision) without building a datetime per row."""
+    return time.strftime("%Y-%m-%dT%H:%M:%S")
+
 # Open log file for appending
-with log_file.open("a", encoding="utf-8") as log:
+with log_file.open("a", encoding="utf-8") as log, ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
     if log.tell() == 0:
         log.write("domain,status,results,timestamp\n")
 
@@ -92,7 +218,7 @@ with log_file.open("a", encoding="utf-8") as log:
 
         if safe in COMPLETED_SAFE_DOMAINS:
             print(f"[SKIP] {domain} (safe='{safe}') already processed in '{STAGING_DIR}'.")
-            log.write(f"{domain},SKIP_EXISTS,0,\"{datetime.now().isoformat()}\"\n")
+            log.write(f"{domain},SKIP_EXISTS,0,\"{_ts()}\"\n")
             continue
 
         print(f"Querying: {domain}")
@@ -103,12 +229,7 @@ with log_file.open("a", encoding="utf-8") as log:
 
         try:
             # /api/dns
-            dns_resp = requests.get(
-                "https://networksdb.io/api/dns",
-                headers=headers,
-                params={"domain": domain},
-                timeout=30
-            )
+            dns_resp = api_request("GET", "https://networksdb.io/api/dns", params={"domain": domain})
             dns_resp.raise_for_status()
             dns_data = dns_resp.json()
             if not isinstance(dns_data, dict):
@@ -125,33 +246,20 @@ with log_file.open("a", encoding="utf-8") as log:
 
             # /api/org-search
             org_name = domain.split(".")[0]
-            org_resp = requests.post(
-                "https://networksdb.io/api/org-search",
-                headers=headers,
-                data={"search": org_name},
-                timeout=30
-            )
+            org_resp = api_request("POST", "https://networksdb.io/api/org-search", data={"search": org_name})
             org_resp.raise_for_status()
             domain_data["org_search"] = org_resp.json()
 
-            # Enrich IPs
-            for ip_entry in ips:
-                ip = ip_entry.get("ip")
-                if not ip:
-                    continue
-
-                ip_info = {"ip": ip}
-
-                # /api/ip-info
-                ip_resp = requests.post(
-                    "https://networksdb.io/api/ip-info",
-                    headers=headers,
-                    data={"ip": ip},
-                    timeout=30
-                )
-                ip_resp.raise_for_status()
-                ip_info["ip_info"] = ip_resp.json()
-
+            # Enrich IPs (concurrently; results keep input order, each IP looked up once)
+            seen_ips = set()
+            ip_list = []
+            for e in ips:
+                ip = e.get("ip")
+                if ip and ip not in seen_ips:
+                    seen_ips.add(ip)
+                    ip_list.append(ip)
+            for ip_info in pool.map(fetch_ip_info, ip_list):
+                ip = ip_info["ip"]
                 try:
                     ip_obj = ipaddress.ip_address(ip)
                     if ip_obj.version == 4:
@@ -163,22 +271,17 @@ with log_file.open("a", encoding="utf-8") as log:
                     ipv4_results.append(ip_info)
                 flat_ips.append(_normalize_ip(ip_info))
 
-                time.sleep(delay_seconds)
-
             domain_data["ipv4_details"] = ipv4_results
             domain_data["ipv6_details"] = ipv6_results
             domain_data["ips"] = flat_ips
 
             # Save JSON output
             output_file = base_output_dir / f"networksdb_{domain.replace('/', '_')}_{today}.json"
-            with output_file.open("w", encoding="utf-8") as outf:
-                json.dump(domain_data, outf, indent=2)
+            write_json(output_file, domain_data)
 
             print(f"Saved: {output_file.name}")
-            log.write(f"{domain},success,{len(ips)},\"{datetime.now().isoformat()}\"\n")
+            log.write(f"{domain},success,{len(ips)},\"{_ts()}\"\n")
 
         except Exception as e:
             print(f"Error for {domain}: {e}")
-            log.write(f"{domain},error,0,\"{datetime.now().isoformat()}\"\n")
-
-        time.sleep(delay_seconds)
\ No newline at end of file
+            log.write(f"{domain},error,0,\"{_ts()}\"\n")
\ No newline at end of file
@@ -1,14 +1,28 @@
 #!/usr/bin/env python3
 from __future__ import annotations
+import atexit
 import csv
 import json
+import os
 import time
-import ipaddress
+import socket
 import requests
+from requests.adapters import HTTPAdapter
 import re
+import random
+import threading
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+# Optional fast JSON backend; the stdlib json module is used when orjson is missing.
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 
 # === CONFIGURATION ===
@@ -33,51 +47,117 @@ LOG_FILE = LOG_DIR / f"modat_log_service_{timestamp}.csv"
 API_URL = "https://api.magnify.modat.io/service/search/v1"
 
 PAGE_SIZE = 100
-MAX_RETRIES = 3
-SLEEP_BETWEEN_IPS = 0.6
-SLEEP_AFTER_BATCH = 30
-BATCH_SIZE = 10
+MAX_RETRIES = 5
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+BACKOFF_BASE = 2.0          # seconds, doubled each attempt
+BACKOFF_MAX = 60.0
+# No documented Modat quota: stay at the original per-IP loop's average rate of 10 requests per
+# ~36 s (0.6 s between IPs, 30 s pause every 10). Batching IPs per query is where the speed-up comes from.
+MAX_WORKERS = 2             # batches queried concurrently
+REQUESTS_PER_SECOND = 10 / 36.0   # shared budget across all workers
+IP_BATCH_SIZE = 20          # IPs OR-ed together in one service query
+
+
+# === RATE LIMITER (shared by all worker threads) ===
+class RateLimiter:
+    """Thread-safe token bucket: at most `rate` requests per `per` seconds."""
+
+    def __init__(self, rate: float, per: float = 1.0):
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.fill_rate = rate / per
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.fill_rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.fill_rate
+            time.sleep(wait)
+
+LIMITER = RateLimiter(REQUESTS_PER_SECOND)
+
+# === HTTP SESSION (keep-alive, pooled connections shared by all workers) ===
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(pool_connections=16, pool_maxsize=32, max_retries=0))
 
 
 # === RESTART / CONTINUE SCAN HELPERS ===
+# [tmp_]modat_service_<safe_ip>_<YYYYMMDD>.json
+_FN_RX = re.compile(r"^(?P<tmp>tmp_)?modat_service_(?P<safeip>.+)_(?P<date>\d{8})\.json$", re.IGNORECASE)
+
 def build_ip_file_index(out_dir: Path) -> dict[str, set[str]]:
     idx: dict[str, set[str]] = defaultdict(set)
-    rx = re.compile(r"^(?:tmp_)?modat_service_(?P<safeip>.+)_(?P<date>\d{8})\.json$", re.IGNORECASE)
 
     if not out_dir.exists():
         return dict(idx)
 
-    for f in out_dir.glob("*.json"):
-        m = rx.match(f.name)
-        if not m:
-            continue
-        idx[m.group("safeip")].add(m.group("date"))
+    match = _FN_RX.match
+    with os.scandir(out_dir) as it:
+        for entry in it:
+            m = match(entry.name)
+            if not m:
+                continue
+            idx[m.group("safeip")].add(m.group("date"))
 
     return dict(idx)
 
 # === IPV4 extraction helpers ===
+# Dotted-quad IPv4 without leading zeros: exactly what ipaddress accepts, minus the object construction
+_V4_OCTET = r"(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)"
+_V4_RX = re.compile(rf"{_V4_OCTET}(?:\.{_V4_OCTET}){{3}}", re.ASCII)
+
 def normalize_ipv4(value) -> str | None:
     if value is None:
         return None
     s = str(value).strip().strip('"').strip("'")
-    if not s:
-        return None
-    try:
-        ip = ipaddress.ip_address(s)
-    except ValueError:
-        return None
-    return str(ip) if ip.version == 4 else None
+    return s if _V4_RX.fullmatch(s) else None
+
+
+def read_json(path: Path):
+    if ORJSON_AVAILABLE:
+        return orjson.loads(path.read_bytes())
+    return json.loads(path.read_text(encoding="utf-8"))
+
+def write_json(path, obj) -> None:
+    """Write to <path>.tmp and rename, so an interrupted run never leaves a truncated .json behind."""
+    tmp = f"{path}.tmp"
+    if ORJSON_AVAILABLE:
+        with open(tmp, "wb") as f_out:
+            f_out.write(orjson.dumps(obj, option=orjson.OPT_INDENT_2))
+    else:
+        with open(tmp, "w", encoding="utf-8") as f_out:
+            json.dump(obj, f_out, indent=2)
+    os.replace(tmp, path)
 
 
-def iter_json_files(folder: Path) -> list[Path]:
+def iter_json_files(folder: Path, suffixes: tuple[str, ...] = (".json",)) -> list[Path]:
     if not folder.exists():
         return []
-    return sorted(p for p in folder.glob("*.json") if p.is_file())
+    return sorted(p for p in folder.iterdir() if p.suffix in suffixes and p.is_file())
+
+
+def iter_jsonl(path: Path):
+    """Records of a .jsonl file, one per line; unreadable lines are skipped."""
+    loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+    with path.open("rb") as f:
+        for line in f:
+            if line.strip():
+                try:
+                    yield loads(line)
+                except ValueError:
+                    continue
 
 
 def extract_ipv4s_from_networksdb_json(path: Path) -> set[str]:
     try:
-        data = json.loads(path.read_text(encoding="utf-8"))
+        data = read_json(path)
     except Exception:
         return set()
 
@@ -104,14 +184,18 @@ def extract_ipv4s_from_networksdb_json(path: Path) -> set[str]:
 
 
 def extract_ipv4s_from_modat_host_json(path: Path) -> set[str]:
-    try:
-        data = json.loads(path.read_text(encoding="utf-8"))
-    except Exception:
-        return set()
-
-    results = data.get("results", data.get("page", []))
-    if not isinstance(results, list):
-        return set()
+    # 1a writes one record per line (.jsonl); older runs wrote {"results": [...]} (.json)
+    if path.suffix == ".jsonl":
+        results = iter_jsonl(path)
+    else:
+        try:
+            data = read_json(path)
+        except Exception:
+            return set()
+
+        results = data.get("results", data.get("page", []))
+        if not isinstance(results, list):
+            return set()
 
     out: set[str] = set()
 
@@ -147,16 +231,44 @@ def extract_ipv4s_from_modat_host_json(path: Path) -> set[str]:
 def write_txt_ips(path: Path, ips: list[str]) -> None:
     path.write_text("\n".join(ips) + ("\n" if ips else ""), encoding="utf-8")
 
+# The log file stays open for the whole run; rows are buffered and written in batches.
+LOG_FLUSH_EVERY = 32        # rows
+LOG_FLUSH_SECONDS = 5.0
+_log_fh = None
+_log_writer = None
+_log_buffer: list[list] = []
+_log_last_flush = time.monotonic()
+
+def _ts() -> str:
+    """UTC log timestamp (ISO-8601, second precision) without building a datetime per row."""
+    return time.strftime("%Y-%m-%dT%H:%M:%S+00:00", time.gmtime())
+
 def init_log() -> None:
+    global _log_fh, _log_writer
     write_header = not LOG_FILE.exists() or LOG_FILE.stat().st_size == 0
-    with LOG_FILE.open("a", newline="", encoding="utf-8") as f:
-        w = csv.writer(f)
-        if write_header:
-            w.writerow(["ip", "status", "results", "timestamp"])
+    _log_fh = LOG_FILE.open("a", newline="", encoding="utf-8", buffering=1 << 16)
+    _log_writer = csv.writer(_log_fh)
+    if write_header:
+        _log_writer.writerow(["ip", "status", "results", "timestamp"])
+    atexit.register(close_log)
+
+def flush_log() -> None:
+    global _log_last_flush
+    if _log_buffer:
+        _log_writer.writerows(_log_buffer)
+        _log_buffer.clear()
+    _log_fh.flush()
+    _log_last_flush = time.monotonic()
+
+def close_log() -> None:
+    if _log_fh is not None and not _log_fh.closed:
+        flush_log()
+        _log_fh.close()
 
 def log_row(ip: str, status: str, count: int) -> None:
-    with LOG_FILE.open("a", newline="", encoding="utf-8") as f:
-        csv.writer(f).writerow([ip, status, count, datetime.now(timezone.utc).isoformat()])
+    _log_buffer.append([ip, status, count, _ts()])
+    if len(_log_buffer) >= LOG_FLUSH_EVERY or time.monotonic() - _log_last_flush >= LOG_FLUSH_SECONDS:
+        flush_log()
 
 
 # === Modat API helpers (service endpoint) ===
@@ -168,18 +280,54 @@ def load_api_key_or_fail() -> str:
         raise RuntimeError(f"Modat API key file is empty: '{API_KEY_FILE}'")
     return token
 
-def fetch_page(headers: dict, query: str, page: int) -> dict | None:
+# === RETRY / BACKOFF ===
+def _server_wait_hint(resp_headers) -> float:
+    """Seconds the server asked us to wait (Retry-After / X-RateLimit-Reset), or 0."""
+    retry_after = resp_headers.get("Retry-After")
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            try:
+                return max(0.0, (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    reset = resp_headers.get("X-RateLimit-Reset")
+    if reset:
+        try:
+            v = float(reset)
+        except ValueError:
+            return 0.0
+        # epoch timestamp vs. delta-seconds
+        return max(0.0, v - time.time()) if v > 1e9 else max(0.0, v)
+    return 0.0
+
+def backoff(attempt: int, resp=None) -> float:
+    """Exponential backoff with jitter, never shorter than what the server asked for."""
+    wait = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+    if resp is not None:
+        wait = max(wait, _server_wait_hint(resp.headers))
+    return wait
+
+def fetch_page(query: str, page: int) -> dict | None:
     payload = {"query": query, "page": page, "page_size": PAGE_SIZE}
     for attempt in range(1, MAX_RETRIES + 1):
-        r = requests.post(API_URL, json=payload, headers=headers, timeout=60)
+        LIMITER.acquire()
+        try:
+            r = SESSION.post(API_URL, json=payload, timeout=60)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            wait = backoff(attempt)
+            print(f"[NET] {e.__class__.__name__} → retry {attempt}/{MAX_RETRIES} in {wait:.1f}s...")
+            time.sleep(wait)
+            continue
         if r.status_code == 200:
             try:
                 return r.json()
             except Exception:
                 return None
-        if r.status_code == 429:
-            wait = 3 * attempt
-            print(f"[429] rate-limit → retry {attempt}/{MAX_RETRIES} in {wait}s...")
+        if r.status_code in RETRY_STATUSES:
+            wait = backoff(attempt, r)
+            print(f"[{r.status_code}] retry {attempt}/{MAX_RETRIES} in {wait:.1f}s...")
             time.sleep(wait)
             continue
         print(f"[HTTP {r.status_code}] {r.text}")
@@ -194,6 +342,21 @@ def extract_results(data: dict) -> list:
 def build_full_query_for_ip(ip: str) -> str:
     return f'ip = "{ip}"'
 
+def build_full_query_for_ips(ips: list[str]) -> str:
+    return " OR ".join(build_full_query_for_ip(ip) for ip in ips)
+
+def _ip_from_service(item) -> str | None:
+    """IPv4 a service record belongs to (top-level or nested under "host")."""
+    if not isinstance(item, dict):
+        return None
+    for src in (item, item.get("host")):
+        if isinstance(src, dict):
+            for k in ("ip", "ip_str", "ip_address"):
+                ip = normalize_ipv4(src.get(k))
+                if ip:
+                    return ip
+    return None
+
 
 # === Resume support: temp file per IP ===
 def safe_ip_for_filename(ip: str) -> str:
@@ -203,41 +366,87 @@ def temp_file_for_ip(ip: str) -> Path:
     safe_ip = safe_ip_for_filename(ip)
     return OUT_DIR / f"modat_service_{safe_ip}_{today}.json"
 
-def load_completed_ips_from_temp() -> set[str]:
-    completed = set()
-    patterns = [
-        f"modat_service_*_{today}.json",
-        f"tmp_modat_service_*_{today}.json",  # compat met andere service-scripts
-    ]
-    for pat in patterns:
-        for f in OUT_DIR.glob(pat):
-            try:
-                data = json.loads(f.read_text(encoding="utf-8"))
-                meta_ip = data.get("ip")
-                if meta_ip:
-                    completed.add(str(meta_ip).strip())
-            except Exception:
-                pass
-    return completed
-
 # === PARSE IP FROM FILENAME ===
 def parse_ip_from_filename(filename: str) -> tuple[str | None, str | None]:
     # Matcht: modat_service_<ip>_<YYYYMMDD>.json
-    if not filename.lower().startswith("modat_service_"):
-        return None, None
-    try:
-        core = filename[len("modat_service_"):]
-        ip, date = core.rsplit("_", 1)
-        date = date.replace(".json", "")
-        return ip.strip(), date.strip()
-    except ValueError:
+    m = _FN_RX.match(filename)
+    if not m or m.group("tmp"):
         return None, None
+    return m.group("safeip").strip(), m.group("date")
+
+
+# === PER-BATCH SCAN (runs in worker threads) ===
+def write_temp_for_ip(ip: str, results: list) -> Path:
+    tmp_path = temp_file_for_ip(ip)
+    write_json(tmp_path, {"ip": ip, "results": results})
+    return tmp_path
+
+def scan_batch(ips: list[str]) -> list[tuple[str, str, int]]:
+    """Query a batch of IPs in one paginated search and split the results per IP."""
+    query = build_full_query_for_ips(ips)
+    label = ips[0] if len(ips) == 1 else f"{ips[0]} .. {ips[-1]} ({len(ips)} IPs)"
+    print(f"[INFO] Fetching services for {label}")
+
+    first = fetch_page(query, 1)
+    if not first:
+        print(f"[ERROR] No/failed response for {label}")
+        return [(ip, "FAIL", 0) for ip in ips]
+
+    pages = first.get("total_pages", 1)
+    results = extract_results(first)
+    collected = list(results)
+
+    print(f"[INFO] {label}: page 1/{pages}, {len(results)} records")
+
+    complete = True
+    for p in range(2, pages + 1):
+        nxt = fetch_page(query, p)
+        if not nxt:
+            print(f"[WARN] {label}: stopped at page {p}")
+            complete = False
+            break
+        page_results = extract_results(nxt)
+        collected.extend(page_results)
+        print(f"[INFO] {label}: page {p}/{pages}, +{len(page_results)} records")
+
+    if not complete:
+        # The missing pages may hold any IP's records, so nothing from this batch is trusted
+        if len(ips) > 1:
+            print(f"[INFO] {label}: incomplete batch → re-querying its IPs one at a time")
+            return [row for ip in ips for row in scan_batch([ip])]
+        # No temp file, so the resume logic picks this IP up again on the next run
+        print(f"[WARN] {label}: incomplete result, no temp file written (will be retried)")
+        return [(ips[0], "PARTIAL", len(collected))]
+
+    # Regroup per IP; a single-IP batch keeps every record as before
+    per_ip: dict[str, list] = {ip: [] for ip in ips}
+    unmatched = 0
+    for item in collected:
+        ip = ips[0] if len(ips) == 1 else _ip_from_service(item)
+        if ip in per_ip:
+            per_ip[ip].append(item)
+        else:
+            unmatched += 1
+    if unmatched:
+        # Can't tell which IP those records belong to; per-IP queries keep every record
+        print(f"[WARN] {label}: {unmatched} records could not be assigned to a queried IP "
+              f"→ re-querying its IPs one at a time")
+        return [row for ip in ips for row in scan_batch([ip])]
+
+    # Write per-IP temp files immediately (for resume)
+    out = []
+    for ip, recs in per_ip.items():
+        write_temp_for_ip(ip, recs)
+        out.append((ip, "OK", len(recs)))
+
+    print(f"[INFO] {label}: collected {len(collected)} service records → temp files in {OUT_DIR}")
+    return out
 
 
 # === MAIN ===
 def main() -> int:
     # 1) Combine + deduplicate all unique IPv4s from both staging folders
-    modat_files = iter_json_files(MODAT_HOST_DIR)
+    modat_files = iter_json_files(MODAT_HOST_DIR, (".json", ".jsonl"))
     net_files = iter_json_files(NETWORKSDB_DIR)
 
     print(f"[INFO] Modat host JSON files : {len(modat_files)} ({MODAT_HOST_DIR})")
@@ -251,8 +460,9 @@ def main() -> int:
     for p in net_files:
         net_ips |= extract_ipv4s_from_networksdb_json(p)
 
-    all_ips = sorted(modat_ips | net_ips, key=lambda s: ipaddress.ip_address(s))
-    extra_net = sorted(net_ips - modat_ips, key=lambda s: ipaddress.ip_address(s))
+    # inet_aton gives the 4 network-order bytes, which sort like the address itself
+    all_ips = sorted(modat_ips | net_ips, key=socket.inet_aton)
+    extra_net = sorted(net_ips - modat_ips, key=socket.inet_aton)
 
     # 2) Write output txt for service scan input
     write_txt_ips(OUT_TXT, all_ips)
@@ -292,12 +502,13 @@ def main() -> int:
     print(f"[INFO] Loaded {len(ips_from_txt)} IPv4s from '{OUT_TXT}' for service rescan.")
 
     token = load_api_key_or_fail()
-    headers = {"Authorization": f"Bearer {token}", "Accept": "application/json"}
+    SESSION.headers.update({"Authorization": f"Bearer {token}", "Accept": "application/json"})
 
     init_log()
 
 # === CONTINUE SCAN / RESCAN ===
-    files = [f.name for f in OUT_DIR.glob("*.json")]
+    with os.scandir(OUT_DIR) as it:
+        files = [e.name for e in it if e.is_file()]
 
     index: dict[str, list[str]] = defaultdict(list)
     for fname in files:
@@ -334,52 +545,25 @@ def main() -> int:
 
     print(f"[INFO] Final IPs to scan this run: {len(ips_to_scan)}")
 
-    scan_count = 0
-
-    for idx, ip in enumerate(ips_to_scan, start=1):
-        if scan_count > 0 and scan_count % BATCH_SIZE == 0:
-            print(f"[INFO] Batch limit reached ({BATCH_SIZE}). Sleeping {SLEEP_AFTER_BATCH}s...")
-            time.sleep(SLEEP_AFTER_BATCH)
-
-        print("\n" + "=" * 80)
-        print(f"[{idx}/{len(ips_to_scan)}] Fetching services for IP: {ip}")
-        query = build_full_query_for_ip(ip)
-        print(query)
-        print("=" * 80)
-
-        first = fetch_page(headers, query, 1)
-        if not first:
-            print(f"[ERROR] No/failed response for IP {ip}")
-            log_row(ip, "FAIL", 0)
-            time.sleep(SLEEP_BETWEEN_IPS)
-            continue
-
-        pages = first.get("total_pages", 1)
-        results = extract_results(first)
-        collected = list(results)
-
-        print(f"[INFO] IP {ip}: page 1/{pages}, {len(results)} records")
-
-        for p in range(2, pages + 1):
-            time.sleep(1.5)
-            nxt = fetch_page(headers, query, p)
-            if not nxt:
-                print(f"[WARN] IP {ip}: stopped at page {p}")
-                break
-            page_results = extract_results(nxt)
-            collected.extend(page_results)
-            print(f"[INFO] IP {ip}: page {p}/{pages}, +{len(page_results)} records")
-
-        # Write per-IP temp file immediately (for resume)
-        tmp_path = temp_file_for_ip(ip)
-        tmp_path.write_text(json.dumps({"ip": ip, "results": collected}, indent=2), encoding="utf-8")
-
-        log_row(ip, "OK", len(collected))
-        print(f"[INFO] IP {ip}: collected {len(collected)} service records → temp {tmp_path}")
-
-        scan_count += 1
-        time.sleep(SLEEP_BETWEEN_IPS)
+    batches = [ips_to_scan[i:i + IP_BATCH_SIZE] for i in range(0, len(ips_to_scan), IP_BATCH_SIZE)]
+    print(f"[INFO] Querying in {len(batches)} batches of up to {IP_BATCH_SIZE} IPs")
 
+    # Workers fetch and write temp files; the log CSV is only written from this thread.
+    done = 0
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as pool:
+        futures = {pool.submit(scan_batch, batch): batch for batch in batches}
+        for fut in as_completed(futures):
+            try:
+                rows = fut.result()
+            except Exception as e:
+                print(f"[ERROR] Batch {futures[fut][0]}..: {e}")
+                rows = [(ip, "ERROR", 0) for ip in futures[fut]]
+            for ip, status, count in rows:
+                log_row(ip, status, count)
+                done += 1
+                print(f"[{done}/{len(ips_to_scan)}] {ip}: {status} ({count} records)")
+
+    close_log()
     print("\n=== SERVICE RESCAN DONE ===")
     print(f"Temp files remain in: {OUT_DIR}")
     print(f"Log written to:      {LOG_FILE}")
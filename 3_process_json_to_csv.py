@@ -2,14 +2,55 @@
 
 from __future__ import annotations
 
+import contextlib
 import csv
+import gc
+import os
 import sys
 import json
+import pickle
+from fnmatch import fnmatch
 import re
 import hashlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from itertools import chain
 from pathlib import Path
 
+# Optional fast JSON backend; the stdlib json module is used when orjson is missing.
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Errors that mean "unreadable service file, skip it" (orjson.JSONDecodeError is a ValueError)
+JSON_ERRORS: tuple[type[Exception], ...] = (OSError, ValueError)
+
+# Optional Arrow CSV writer (quoting and encoding done in C); csv.writer is used when pyarrow is missing.
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Change-detection digest for the manifest (not security relevant): BLAKE3 if installed,
+# otherwise the stdlib's BLAKE2b, which is also faster than SHA-256 in software.
+try:
+    from blake3 import blake3 as _blake3
+    FINGERPRINT_ALGO = "blake3"
+except ImportError:
+    _blake3 = None
+    FINGERPRINT_ALGO = "blake2b"
+
 PROGRESS_EVERY_N_FILES = 25
+CSV_WRITE_BUFFER = 1 << 20
+ARROW_BATCH_ROWS = 8192     # rows per RecordBatch handed to the Arrow CSV writer
+FILES_PER_TASK = 16         # files handed to a worker at once
+READ_AHEAD_THREADS = 4      # per process, overlap file reads with parsing
+# Below this many files per worker, process start-up costs more than it saves.
+MIN_FILES_PER_WORKER = 50
 
 # ============================================================
 # PATHS
@@ -21,6 +62,10 @@ OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
 OUT_CSV = OUTPUT_DIR / "modat_service_all.csv"
 TMP_CSV = OUTPUT_DIR / (OUT_CSV.name + ".tmp")
 MANIFEST_FILE = OUTPUT_DIR / "_manifest_modat_service.json"
+ROWCACHE_DIR = OUTPUT_DIR / "_rowcache"
+# Part of every row cache stamp: bump it whenever flatten/cleaning/row building or the cached
+# chunk format changes, so rows pickled by an older version are rebuilt instead of reused.
+ROWCACHE_VERSION = 1
 
 DIR_1A = Path("./staging/1a_modat_host_api")
 DIR_1B = Path("./staging/1b_networksdb_api")
@@ -30,7 +75,29 @@ DIR_1B = Path("./staging/1b_networksdb_api")
 # SMALL UTILITIES
 # ============================================================
 DOMAIN_RE = re.compile(r"^(?!-)(?:[a-z0-9-]{1,63}\.)+[a-z]{2,63}$", re.IGNORECASE)
+_domain_fullmatch = DOMAIN_RE.fullmatch
 SEP_SPLIT_RE = re.compile(r"[\s;|,]+")
+_CLEAN_TRANS = str.maketrans({"\r": " ", "\n": " ", "\t": " "})
+# 1a output: modat_host_<label>_<YYYYMMDD>.json[l]
+_HOST_LABEL_RE = re.compile(r"^modat_host_(?P<label>.+)_(?P<date>\d{8})\.jsonl?$", re.IGNORECASE)
+# Service file stem: modat_service_<ip>_<date>; the date is whatever follows the last "_"
+_SERVICE_NAME_RE = re.compile(r"^modat_service_(?P<ip>.*)_(?P<date>[^_]*)$")
+
+def read_json(path: Path):
+    if ORJSON_AVAILABLE:
+        return orjson.loads(path.read_bytes())
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def scan_files(folder: Path, pattern: str) -> list[os.DirEntry]:
+    """Files in `folder` matching a glob pattern, sorted by name; DirEntry caches its stat()."""
+    if not folder.is_dir():
+        return []
+    with os.scandir(folder) as it:
+        entries = [e for e in it if fnmatch(e.name, pattern) and e.is_file()]
+    entries.sort(key=lambda e: e.name)
+    return entries
+
 
 def ask_yes_no(prompt: str, default_yes: bool = True) -> bool:
     ans = input(prompt).strip().lower()
@@ -41,32 +108,44 @@ def ask_yes_no(prompt: str, default_yes: bool = True) -> bool:
 
 def clean_for_csv(value) -> str:
     """Minimal cleaning; keep semicolons intact."""
-    if value is None:
+    # Most leaves are strings: check that first and skip the other type tests
+    if type(value) is str:
+        text = value
+    elif value is None:
         return ""
-    if isinstance(value, bool):
+    elif isinstance(value, bool):
         return "true" if value else "false"
-    if isinstance(value, (int, float)):
+    elif isinstance(value, (int, float)):
         return str(value)
-
-    text = str(value)
-    # Normalize whitespace, remove newlines/tabs
-    text = text.replace("\r\n", " ").replace("\n", " ").replace("\r", " ").replace("\t", " ")
+    else:
+        text = str(value)
+    # Normalize whitespace, remove newlines/tabs (CRLF first so it stays a single space)
+    if "\r\n" in text:
+        text = text.replace("\r\n", " ")
+    text = text.translate(_CLEAN_TRANS)
     text = text.strip().strip('"').strip("'")
     return text
 
 
+# json.dumps with non-default options builds a new encoder per call; reuse one
+_encode_json_sorted = json.JSONEncoder(ensure_ascii=False, sort_keys=True).encode
+
+
 def dict_to_clean_string(obj) -> str:
     try:
-        return clean_for_csv(json.dumps(obj, ensure_ascii=False, sort_keys=True))
+        return clean_for_csv(_encode_json_sorted(obj))
     except Exception:
         return clean_for_csv(str(obj))
 
 def normalize_fqdns(value) -> list[str]:
+    _split = SEP_SPLIT_RE.split
+
     def split_one(s: str) -> list[str]:
-        parts = SEP_SPLIT_RE.split(s.strip())
+        parts = _split(s.strip())
         out = []
         for p in parts:
-            t = p.strip().strip(".")
+            # split() already removed the whitespace around each part
+            t = p.strip(".")
             if t:
                 out.append(t)
         return out
@@ -102,7 +181,7 @@ def normalize_domain_token(token: str) -> str | None:
     d = token.strip().lower().strip(".")
     if not d:
         return None
-    if DOMAIN_RE.fullmatch(d):
+    if _domain_fullmatch(d):
         return d
     return None
 
@@ -110,44 +189,65 @@ def normalize_domain_token(token: str) -> str | None:
 def split_to_domains(value: str) -> list[str]:
     parts = SEP_SPLIT_RE.split(value.strip())
     out = []
+    normalize = normalize_domain_token
     for p in parts:
-        dom = normalize_domain_token(p)
+        dom = normalize(p)
         if dom:
             out.append(dom)
     return out
 
 
+# Column names repeat in every row; one shared str per name keeps rows (and their pickles) small
+_KEY_CACHE: dict[str, str] = {}
+
+
 def flatten(obj, parent_key: str = "", sep: str = ".") -> dict[str, str]:
+    # Iterative depth-first walk writing into one dict. Children are pushed in reverse so they are
+    # visited (and overwrite each other) in the same order as a recursive walk would.
     items: dict[str, str] = {}
+    stack = [(obj, parent_key)]
+    pop, push_all = stack.pop, stack.extend
+    clean = clean_for_csv
+    key = _KEY_CACHE.setdefault
+
+    while stack:
+        cur, pk = pop()
+
+        if isinstance(cur, dict):
+            children = []
+            for k, v in cur.items():
+                new_key = f"{pk}{sep}{k}" if pk else str(k)
+                new_key = key(new_key, new_key)
+
+                # Skip raw certificate
+                if new_key == "service.tls.raw":
+                    continue
+
+                children.append((v, new_key))
+            children.reverse()
+            push_all(children)
+            continue
 
-    if isinstance(obj, dict):
-        for k, v in obj.items():
-            new_key = f"{parent_key}{sep}{k}" if parent_key else str(k)
-
-            # Skip raw certificate
-            if new_key == "service.tls.raw":
+        if isinstance(cur, list):
+            # Always add count for lists (helps analysis)
+            count_key = pk + "_count"
+            count_key = key(count_key, count_key)
+            if pk:
+                items[count_key] = str(len(cur))
+
+            # List of primitives: join into one cell (use ';' to avoid '-' ambiguity)
+            if all(not isinstance(x, (dict, list)) for x in cur):
+                vals = [str(x) for x in cur if x is not None]
+                items[pk] = clean(";".join(vals))
+                items[count_key] = str(len(vals))
                 continue
 
-            items.update(flatten(v, new_key, sep=sep))
-        return items
-
-    if isinstance(obj, list):
-        # Always add count for lists (helps analysis)
-        if parent_key:
-            items[parent_key + "_count"] = str(len(obj))
-
-        # List of primitives: join into one cell (use ';' to avoid '-' ambiguity)
-        if all(not isinstance(x, (dict, list)) for x in obj):
-            vals = [str(x) for x in obj if x is not None]
-            items[parent_key] = clean_for_csv(";".join(vals))
-            items[parent_key + "_count"] = str(len(vals))
-            return items
+            # List containing dict/list: stringify (keeps minimal complexity)
+            items[pk] = dict_to_clean_string(cur)
+            continue
 
-        # List containing dict/list: stringify (keeps minimal complexity)
-        items[parent_key] = dict_to_clean_string(obj)
-        return items
+        items[pk] = clean(cur)
 
-    items[parent_key] = clean_for_csv(obj)
     return items
 
 
@@ -162,74 +262,119 @@ def build_known_domains_index() -> set[str]:
     known: set[str] = set()
 
     # 1b: read domain
-    if DIR_1B.exists():
-        for f in DIR_1B.glob("*.json"):
-            try:
-                data = json.loads(f.read_text(encoding="utf-8"))
-                d = data.get("domain")
-                if isinstance(d, str) and d.strip():
-                    for dom in split_to_domains(d):
-                        known.add(dom)
-            except Exception:
-                pass
+    for e in scan_files(DIR_1B, "*.json"):
+        try:
+            data = read_json(Path(e.path))
+            d = data.get("domain")
+            if isinstance(d, str) and d.strip():
+                for dom in split_to_domains(d):
+                    known.add(dom)
+        except Exception:
+            pass
 
     # 1a: infer label from filename
-    rx = re.compile(r"^modat_host_(?P<label>.+)_(?P<date>\d{8})\.json$", re.IGNORECASE)
-    if DIR_1A.exists():
-        for f in DIR_1A.glob("modat_host_*_*.json"):
-            m = rx.match(f.name)
-            if not m:
-                continue
-            label = m.group("label")
-            if isinstance(label, str) and label.strip():
-                # IMPORTANT: split label to avoid "ibm.com<TAB>maersk.com" becoming one known domain
-                for dom in split_to_domains(label):
-                    known.add(dom)
+    match = _HOST_LABEL_RE.match
+    for e in scan_files(DIR_1A, "modat_host_*_*.json*"):
+        m = match(e.name)
+        if not m:
+            continue
+        label = m.group("label")
+        if isinstance(label, str) and label.strip():
+            # IMPORTANT: split label to avoid "ibm.com<TAB>maersk.com" becoming one known domain
+            for dom in split_to_domains(label):
+                known.add(dom)
     return known
 
 
-def match_nidv_company(fqdns: list[str], known_domains: set[str]) -> str:
-    matches = set()
-    for fqdn in fqdns or []:
-        h = extract_base_from_fqdn(fqdn).strip(".")
-        if not h:
-            continue
-        # Fast exact match
-        if h in known_domains:
-            matches.add(h)
-            continue
-        # Suffix match
-        for dom in known_domains:
-            if h.endswith("." + dom):
-                matches.add(dom)
-    return ";".join(sorted(matches))
+def build_suffix_trie(known_domains: set[str]) -> dict:
+    """Reversed-label trie: "example.com" is stored under com -> example, with "$" marking the domain."""
+    trie: dict = {}
+    for dom in known_domains:
+        node = trie
+        for label in reversed(dom.split(".")):
+            node = node.setdefault(label, {})
+        node["$"] = dom
+    return trie
+
+
+def match_fqdn(fqdn: str, suffix_trie: dict) -> tuple[str, ...]:
+    """Known domains one FQDN falls under: itself if it is known, otherwise every known parent."""
+    h = extract_base_from_fqdn(fqdn)
+    if not h:
+        return ()
+    node = suffix_trie
+    suffixes = []
+    for label in reversed(h.split(".")):
+        node = node.get(label)
+        if node is None:
+            break
+        if "$" in node:
+            suffixes.append(node["$"])
+    else:
+        # Exact match: the FQDN itself is a known domain, its parents are not reported
+        if "$" in node:
+            return (node["$"],)
+    return tuple(suffixes)
+
+
+def make_nidv_matcher(suffix_trie: dict):
+    """
+    fqdns -> ";"-joined sorted known domains they fall under, for one trie. Memoised per FQDN
+    and per FQDN set (hosts recur across ports/services).
+    """
+    @lru_cache(maxsize=200_000)
+    def _match_one(fqdn: str) -> tuple[str, ...]:
+        return match_fqdn(fqdn, suffix_trie)
+
+    @lru_cache(maxsize=None)
+    def _match(fqdn_set: frozenset[str]) -> str:
+        matches = set()
+        for fqdn in fqdn_set:
+            matches.update(_match_one(fqdn))
+        return ";".join(sorted(matches))
+
+    def match(fqdns: list[str]) -> str:
+        return _match(frozenset(fqdns or ()))
+
+    return match
 
 
 # ============================================================
 # MANIFEST (redo/skip)
 # ============================================================
 def dataset_fingerprint(service_dir: Path) -> dict:
-    files = sorted(service_dir.glob("modat_service_*_*.json"))
     items = []
-    for f in files:
-        st = f.stat()
-        items.append({"name": f.name, "size": st.st_size, "mtime": int(st.st_mtime)})
-
-    blob = json.dumps(items, separators=(",", ":"), sort_keys=True).encode("utf-8")
-    return {"sha256": hashlib.sha256(blob).hexdigest(), "file_count": len(items), "files": items}
+    for e in scan_files(service_dir, "modat_service_*_*.json"):
+        st = e.stat()
+        items.append({"name": e.name, "size": st.st_size, "mtime": int(st.st_mtime)})
+
+    # Same bytes from both backends (filenames are ASCII), so the fingerprint is stable either way
+    if ORJSON_AVAILABLE:
+        blob = orjson.dumps(items, option=orjson.OPT_SORT_KEYS)
+    else:
+        blob = json.dumps(items, separators=(",", ":"), sort_keys=True).encode("utf-8")
+    if _blake3 is not None:
+        digest = _blake3(blob).hexdigest()
+    else:
+        digest = hashlib.blake2b(blob, digest_size=32).hexdigest()
+    # Algorithm is part of the value, so manifests from another algorithm (or the old "sha256" field) count as changed
+    return {"digest": f"{FINGERPRINT_ALGO}:{digest}", "file_count": len(items), "files": items}
 
 
 def load_manifest() -> dict | None:
     if not MANIFEST_FILE.exists():
         return None
     try:
-        return json.loads(MANIFEST_FILE.read_text(encoding="utf-8"))
+        return read_json(MANIFEST_FILE)
     except Exception:
         return None
 
 
 def save_manifest(m: dict) -> None:
-    MANIFEST_FILE.write_text(json.dumps(m, indent=2), encoding="utf-8")
+    if ORJSON_AVAILABLE:
+        MANIFEST_FILE.write_bytes(orjson.dumps(m, option=orjson.OPT_INDENT_2))
+    else:
+        MANIFEST_FILE.write_text(json.dumps(m, indent=2), encoding="utf-8")
 
 
 def atomic_replace(tmp_path: Path, final_path: Path) -> None:
@@ -251,42 +396,52 @@ def progress_update(i: int, total: int, every: int = 25) -> None:
 # ============================================================
 # CORE PROCESSING
 # ============================================================
-def process_service_jsons_to_one_csv(service_dir: Path, output_csv_tmp: Path) -> bool:
-    if not service_dir.exists():
-        print(f"[ERROR] Directory not found: {service_dir}")
-        return False
+def iter_service_results(blob: bytes):
+    """Yield the records under "results"; the file is already in memory, so it is parsed in one go."""
+    data = orjson.loads(blob) if ORJSON_AVAILABLE else json.loads(blob)
+    results = data.get("results", []) if isinstance(data, dict) else []
+    if isinstance(results, list):
+        yield from results
 
-    json_files = sorted(service_dir.glob("modat_service_*_*.json"))
-    if not json_files:
-        print(f"[ERROR] No service JSON files found in: {service_dir}")
-        return False
 
-    known_domains = build_known_domains_index()
-    print(f"[INFO] Known domain/company labels loaded: {len(known_domains)}")
+# Set per worker process by _init_worker (or directly when running in-process)
+_match_nidv = None
+_reader: ThreadPoolExecutor | None = None
 
-    all_rows: list[dict[str, str]] = []
-    all_headers: set[str] = set()
 
-    total_files = len(json_files)
+def _init_worker(suffix_trie: dict) -> None:
+    global _match_nidv, _reader
+    _match_nidv = make_nidv_matcher(suffix_trie)
+    _reader = ThreadPoolExecutor(max_workers=READ_AHEAD_THREADS)
 
-    for i, jf in enumerate(json_files, start=1):
-        progress_update(i, total_files, every=PROGRESS_EVERY_N_FILES)
-        try:
-            data = json.loads(jf.read_text(encoding="utf-8"))
-        except Exception:
-            continue
 
-        results = data.get("results", [])
-        if not isinstance(results, list):
-            continue
+def _read_bytes(path: Path) -> bytes | None:
+    try:
+        return path.read_bytes()
+    except OSError:
+        return None
+
 
-        # trace from filename: modat_service_<ip>_<YYYYMMDD>.json
-        source_file = jf.name
-        parts = jf.stem.split("_")
-        source_ip = "_".join(parts[2:-1]) if len(parts) >= 4 else ""
-        scan_date = parts[-1] if parts else ""
+def process_service_batch(paths: list[Path]) -> list[tuple[bytes, set[str], int] | None]:
+    """Process a batch of files in order while reader threads load the next files (read() releases the GIL)."""
+    return [process_service_file(jf, blob) for jf, blob in zip(paths, _reader.map(_read_bytes, paths))]
 
-        for result in results:
+
+def process_service_file(jf: Path, blob: bytes | None) -> tuple[bytes, set[str], int] | None:
+    """Flatten one service file. Returns (pickled rows, headers, row count), or None if unreadable/empty."""
+    # trace from filename: modat_service_<ip>_<YYYYMMDD>.json
+    source_file = jf.name
+    m = _SERVICE_NAME_RE.match(jf.stem)
+    source_ip = m.group("ip") if m else ""
+    scan_date = m.group("date") if m else ""
+
+    if blob is None:
+        return None
+
+    # Rows are kept per file so a file that turns out to be broken halfway adds nothing
+    file_rows: list[dict[str, str]] = []
+    try:
+        for result in iter_service_results(blob):
             if not isinstance(result, dict):
                 continue
 
@@ -300,32 +455,194 @@ def process_service_jsons_to_one_csv(service_dir: Path, output_csv_tmp: Path) ->
             row["fqdns"] = row["fqdns"].replace("\t", ";")
             row["fqdns_count"] = str(len(fqdns_norm))
 
-            row["nidv_company"] = match_nidv_company(fqdns_norm, known_domains)
+            row["nidv_company"] = _match_nidv(fqdns_norm)
             row["nidv_hit"] = "1" if row["nidv_company"] else "0"
 
             row["source_file"] = source_file
             row["source_ip"] = source_ip
             row["scan_date"] = scan_date
 
-            all_rows.append(row)
-            all_headers.update(row.keys())
+            file_rows.append(row)
+    except JSON_ERRORS:
+        return None
 
-    sys.stdout.write("\n")
-    sys.stdout.flush()
+    if not file_rows:
+        return None
+
+    # Store the file column-wise: one list per column, "" where a row has no such key
+    n = len(file_rows)
+    columns: dict[str, list[str]] = {}
+    for i, row in enumerate(file_rows):
+        for k, v in row.items():
+            col = columns.get(k)
+            if col is None:
+                col = columns[k] = [""] * n
+            col[i] = v
+
+    # Pickled here so the main process can append it to the shard as-is
+    return pickle.dumps((n, columns), protocol=pickle.HIGHEST_PROTOCOL), set(columns), n
 
-    if not all_rows:
+
+# Row cache: _rowcache/<service file>.pkl holds a (stamp, headers, row count) pickle,
+# followed by the file's pickled (n, columns) chunk when it has rows.
+def _rowcache_path(name: str) -> Path:
+    return ROWCACHE_DIR / f"{name}.pkl"
+
+
+def read_rowcache_meta(name: str) -> tuple | None:
+    try:
+        with _rowcache_path(name).open("rb") as f:
+            return pickle.load(f)
+    except (OSError, EOFError, pickle.UnpicklingError):
+        return None
+
+
+def write_rowcache(name: str, stamp: tuple, headers: set[str], count: int, blob: bytes | None) -> None:
+    path = _rowcache_path(name)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        pickle.dump((stamp, headers, count), f, protocol=pickle.HIGHEST_PROTOCOL)
+        if blob is not None:
+            f.write(blob)
+    tmp.replace(path)
+
+
+def iter_rowcache_chunks(names):
+    """(row count, columns) chunks from the row cache, one per source file, in the given order."""
+    for name in names:
+        with _rowcache_path(name).open("rb") as f:
+            _, _, count = pickle.load(f)
+            if count:
+                yield pickle.load(f)
+
+
+def write_csv_stdlib(path: Path, headers: list[str], chunks) -> None:
+    # 1 MiB write buffer; rows go out one shard chunk (= one source file) per writerows call
+    with path.open("w", newline="", encoding="utf-8-sig", buffering=CSV_WRITE_BUFFER) as f:
+        w = csv.writer(f, quoting=csv.QUOTE_ALL, lineterminator="\n")
+        w.writerow(headers)
+        for n, columns in chunks:
+            blank = [""] * n
+            w.writerows(zip(*[columns.get(h, blank) for h in headers]))
+
+
+def write_csv_arrow(path: Path, headers: list[str], chunks) -> None:
+    # Same bytes as write_csv_stdlib: BOM, every value quoted, "\n" line endings
+    schema = pa.schema([(h, pa.string()) for h in headers])
+    options = pa_csv.WriteOptions(quoting_style="all_valid")
+    pending: list[list[str]] = [[] for _ in headers]
+    pending_rows = 0
+
+    with path.open("wb", buffering=CSV_WRITE_BUFFER) as f:
+        f.write("\ufeff".encode("utf-8"))
+        with pa_csv.CSVWriter(f, schema, write_options=options) as writer:
+
+            def flush() -> None:
+                nonlocal pending_rows
+                arrays = [pa.array(col, type=pa.string()) for col in pending]
+                writer.write_batch(pa.record_batch(arrays, schema=schema))
+                for col in pending:
+                    col.clear()
+                pending_rows = 0
+
+            for n, columns in chunks:
+                blank = [""] * n
+                for h, col in zip(headers, pending):
+                    col.extend(columns.get(h, blank))
+                pending_rows += n
+                if pending_rows >= ARROW_BATCH_ROWS:
+                    flush()
+            if pending_rows:
+                flush()
+
+
+def process_service_jsons_to_one_csv(service_dir: Path, output_csv_tmp: Path) -> bool:
+    if not service_dir.exists():
+        print(f"[ERROR] Directory not found: {service_dir}")
+        return False
+
+    entries = scan_files(service_dir, "modat_service_*_*.json")
+    if not entries:
+        print(f"[ERROR] No service JSON files found in: {service_dir}")
+        return False
+
+    known_domains = build_known_domains_index()
+    print(f"[INFO] Known domain/company labels loaded: {len(known_domains)}")
+    suffix_trie = build_suffix_trie(known_domains)
+
+    # Pass 1 makes sure every file has an up-to-date row cache entry and only keeps the header set;
+    # pass 2 streams the cached chunks into the CSV once all columns are known.
+    # A cache entry is reused while the file's size/mtime, the known-domain set and ROWCACHE_VERSION
+    # are unchanged.
+    ROWCACHE_DIR.mkdir(parents=True, exist_ok=True)
+    known_digest = hashlib.blake2b("\n".join(sorted(known_domains)).encode("utf-8"), digest_size=16).hexdigest()
+
+    all_headers: set[str] = set()
+    row_count = 0
+    stamps: dict[str, tuple] = {}
+    todo: list[Path] = []
+
+    for e in entries:
+        st = e.stat()
+        stamp = (ROWCACHE_VERSION, st.st_size, st.st_mtime_ns, known_digest)
+        stamps[e.name] = stamp
+        meta = read_rowcache_meta(e.name)
+        if meta is not None and meta[0] == stamp:
+            all_headers |= meta[1]
+            row_count += meta[2]
+        else:
+            todo.append(Path(e.path))
+
+    print(f"[INFO] Row cache: {len(entries) - len(todo)} of {len(entries)} files unchanged, {len(todo)} to process")
+
+    total_files = len(todo)
+    workers = min(os.cpu_count() or 1, -(-total_files // MIN_FILES_PER_WORKER))
+    batches = [todo[i:i + FILES_PER_TASK] for i in range(0, total_files, FILES_PER_TASK)]
+
+    with contextlib.ExitStack() as stack:
+        if workers > 1:
+            # Files are independent; map() keeps their order so results line up with `todo`
+            pool = stack.enter_context(
+                ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(suffix_trie,))
+            )
+            batch_results = pool.map(process_service_batch, batches)
+        else:
+            _init_worker(suffix_trie)
+            batch_results = map(process_service_batch, batches)
+
+        for i, (jf, res) in enumerate(zip(todo, chain.from_iterable(batch_results)), start=1):
+            progress_update(i, total_files, every=PROGRESS_EVERY_N_FILES)
+            # Unreadable/empty files are cached too, so they are not re-read until they change
+            blob, headers, count = res if res is not None else (None, set(), 0)
+            write_rowcache(jf.name, stamps[jf.name], headers, count, blob)
+            all_headers |= headers
+            row_count += count
+
+    # Drop cache entries of files that are gone, and temp files left by an interrupted write_rowcache
+    with os.scandir(ROWCACHE_DIR) as it:
+        for c in it:
+            if c.name.endswith(".pkl.tmp") or (c.name.endswith(".pkl") and c.name[:-4] not in stamps):
+                os.remove(c.path)
+
+    gc.collect()
+
+    if total_files:
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+
+    if not row_count:
         print("[ERROR] No rows collected; not writing CSV.")
         return False
 
     headers = sorted(all_headers)
+    chunks = iter_rowcache_chunks(e.name for e in entries)
 
-    with output_csv_tmp.open("w", newline="", encoding="utf-8-sig") as f:
-        w = csv.DictWriter(f, fieldnames=headers, quoting=csv.QUOTE_ALL, lineterminator="\n")
-        w.writeheader()
-        for r in all_rows:
-            w.writerow({h: r.get(h, "") for h in headers})
+    if PYARROW_AVAILABLE:
+        write_csv_arrow(output_csv_tmp, headers, chunks)
+    else:
+        write_csv_stdlib(output_csv_tmp, headers, chunks)
 
-    print(f"[INFO] Rows: {len(all_rows)}  Columns: {len(headers)}")
+    print(f"[INFO] Rows: {row_count}  Columns: {len(headers)}")
     return True
 
 
@@ -336,7 +653,7 @@ def main() -> int:
     unchanged = (
         OUT_CSV.exists()
         and old_fp is not None
-        and old_fp.get("sha256") == new_fp.get("sha256")
+        and old_fp.get("digest") == new_fp.get("digest")
     )
 
     if unchanged:
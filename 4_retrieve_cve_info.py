@@ -2,33 +2,138 @@
 from __future__ import annotations
 
 import argparse
+import asyncio
+import contextlib
 import csv
+import io
+import itertools
+import queue
 import json
 import re
+import sqlite3
 import sys
+import threading
 import time
-from datetime import datetime, timezone
+import zlib
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Set
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 import requests
+from requests.adapters import HTTPAdapter
+
+# Optional fast JSON backend; the stdlib json module is used when orjson is missing.
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Optional zstd framing for the JSONL export (.jsonl.zst); plain .jsonl is written when zstandard is missing.
+try:
+    import zstandard as zstd
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
+# Optional Arrow CSV reader (parses only the CVE column in C++); csv.DictReader is used when pyarrow is missing.
+try:
+    import pyarrow as pa
+    import pyarrow.compute
+    import pyarrow.csv as pa_csv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# Optional async HTTP client; requests worker threads are used when no async client is installed.
+try:
+    import aiohttp
+    AIOHTTP_AVAILABLE = True
+except ImportError:
+    AIOHTTP_AVAILABLE = False
+
+# Optional HTTP/2 client: one TLS connection multiplexes all in-flight lookups (needs httpx[http2]).
+try:
+    import httpx
+    import h2  # noqa: F401  (httpx only negotiates HTTP/2 when h2 is importable)
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+# Optional C ISO-8601 parser for the fetched_at freshness checks; datetime.fromisoformat is used when missing.
+try:
+    import ciso8601
+    CISO8601_AVAILABLE = True
+except ImportError:
+    CISO8601_AVAILABLE = False
+
+ASYNC_NET_ERRORS: Tuple[type, ...] = (asyncio.TimeoutError,)
+if AIOHTTP_AVAILABLE:
+    ASYNC_NET_ERRORS += (aiohttp.ClientError,)
+if HTTPX_AVAILABLE:
+    ASYNC_NET_ERRORS += (httpx.HTTPError,)
 
 # ──────────────────────────────────────────────────────────────
 # CONFIG (defaults)
 # ──────────────────────────────────────────────────────────────
-csv.field_size_limit(5000000)
+# The limit applies to every column of the service CSV, and script 3 keeps HTTP bodies/headers
+# untruncated, so it must be generous (same 100 MB as notebook 7); only the CVE cell is bounded,
+# via MAX_CVE_CELL_CHARS. Rows above even this limit are skipped with a warning.
+csv.field_size_limit(min(100 * 1024 * 1024, sys.maxsize))
 
 DEFAULT_INPUT_CSV = Path(r".\staging\3_prepare_analyses\modat_service_all.csv")
-NVD_API_BASE = "https://services.nvd.nist.gov/rest/json/cves/2.0?cveId="
+NVD_API_ROOT = "https://services.nvd.nist.gov/rest/json/cves/2.0"
+NVD_API_BASE = NVD_API_ROOT + "?cveId="
 
 DEFAULT_USER_AGENT = "CVE-Scanner"
-DEFAULT_REQUEST_DELAY_SEC = 0.75     # base throttle (tune with API key)
+DEFAULT_REQUEST_DELAY_SEC = 0.75     # first retry wait after a 429/network error (grows by backoff)
 DEFAULT_RETRY_LIMIT = 10
-DEFAULT_BACKOFF_MULTIPLIER = 1.7
-
-# How often to checkpoint (rewrite output JSONL atomically)
+DEFAULT_BACKOFF_MULTIPLIER = 1.7     # retry wait grows by this factor per attempt
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+DEFAULT_CONCURRENCY = 19             # max NVD requests in flight (aiohttp tasks / requests worker threads)
+FETCH_QUEUE_SIZE = 1024              # fetched-but-unhandled results buffered between workers and writer
+
+# NVD public rate limits: requests per rolling window, with and without an API key
+NVD_RATE_WINDOW_SEC = 30.0
+NVD_RATE_WITH_KEY = 50
+NVD_RATE_NO_KEY = 5
+
+# --bulk: walk publication-date windows instead of one request per CVE
+NVD_BULK_PAGE_SIZE = 2000         # API maximum resultsPerPage
+NVD_BULK_MAX_WINDOW_DAYS = 120    # API maximum pubStartDate..pubEndDate range
+BULK_MIN_PER_YEAR = 500           # only bulk-fetch CVE-ID years with at least this many wanted CVEs
+
+# Local NVD response cache (skips HTTP for CVEs fetched within the TTL)
+NVD_CACHE_FILENAME = "nvd_response_cache.sqlite3"
+DEFAULT_CACHE_TTL_HOURS = 24.0
+
+# How often to checkpoint (commit the SQLite record store; JSONL/CSV are exported at the end)
 CHECKPOINT_EVERY = 25
 
+# Arrow read block size; must exceed the longest CSV row
+ARROW_BLOCK_SIZE = 1 << 26
+
+# Only the first MAX_CVE_CELL_CHARS of a service.cves cell are scanned (bounds memory per row)
+MAX_CVE_CELL_CHARS = 1_000_000
+
+# Column order of the flat CVE CSV (records_to_flat_rows yields tuples in this order)
+CSV_FIELDNAMES = ("cve_id", "published", "lastModified", "nvd_metrics_json", "description_en")
+
+# Store rows per batch when exporting (one JSONL write and one csv writerows call per batch)
+EXPORT_BATCH_ROWS = 1000
+
+# zstd level for the JSONL export (NVD JSON compresses ~10x at level 3)
+ZSTD_LEVEL = 3
+
+# Leading cve_id of a JSONL record (our own records always start with it)
+_JSONL_ID_PREFIX_RE = re.compile(rb'\s*\{\s*"(?:cve_id|cveId)"\s*:\s*"([^"\\]*)"')
+
+# NVD metric families that count as "has a CVSS score"
+CVSS_METRIC_KEYS = ("cvssMetricV2", "cvssMetricV30", "cvssMetricV31", "cvssMetricV40")
+
 # CVE regex (robust across CSV cells / lists)
 CVE_RE = re.compile(r"\bCVE-\d{4}-\d{4,7}\b", re.IGNORECASE)
 
@@ -45,12 +150,58 @@ def safe_float(x: Any) -> Optional[float]:
         return None
 
 
+def dumps_bytes(obj: Any) -> bytes:
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    # compact separators match orjson, so the JSONL bytes don't depend on which backend is installed
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+
+# json.dumps(obj, ensure_ascii=False) builds a new encoder per call; the CSV metrics column reuses one
+_encode_metrics_json = json.JSONEncoder(ensure_ascii=False).encode
+
+
+def read_cve_column_arrow(csv_path: Path, cve_column: str) -> Optional[str]:
+    """All non-empty cells of cve_column joined by newlines, or None if Arrow can't read the file."""
+    try:
+        tbl = pa_csv.read_csv(
+            csv_path,
+            read_options=pa_csv.ReadOptions(block_size=ARROW_BLOCK_SIZE),
+            parse_options=pa_csv.ParseOptions(newlines_in_values=True),
+            convert_options=pa_csv.ConvertOptions(
+                include_columns=[cve_column],
+                column_types={cve_column: pa.string()},
+            ),
+        )
+    except (pa.ArrowInvalid, KeyError) as e:
+        # missing column, oversized row, ... → the csv path reports or handles it
+        print(f"[WARN] pyarrow could not read '{csv_path.name}' ({e}); falling back to csv module")
+        return None
+    col = pa.compute.utf8_slice_codeunits(tbl.column(cve_column).combine_chunks(), 0, MAX_CVE_CELL_CHARS)
+    # Newline-terminate every cell in C++, then decode the contiguous value buffer once
+    # (no Python str per row); nulls are dropped first because joining them yields null
+    col = pa.compute.binary_join_element_wise(pa.compute.drop_null(col), "", "\n")
+    if len(col) == 0:
+        return ""
+    _, offsets, data = col.buffers()
+    offsets = memoryview(offsets).cast("i")  # int32 offsets of the pa.string() column
+    return str(memoryview(data)[offsets[col.offset]:offsets[col.offset + len(col)]], "utf-8")
+
+
 def extract_unique_cves_from_csv(csv_path: Path, cve_column: str = "service.cves") -> List[str]:
     if not csv_path.exists():
         raise FileNotFoundError(f"Input CSV not found: {csv_path}")
 
     found: Set[str] = set()
 
+    if PYARROW_AVAILABLE:
+        text = read_cve_column_arrow(csv_path, cve_column)
+        if text is not None:
+            found.update(m.upper() for m in CVE_RE.findall(text))
+            return sorted(found)
+
     with csv_path.open("r", encoding="utf-8", newline="") as f:
         reader = csv.DictReader(f)
         if not reader.fieldnames:
@@ -61,30 +212,52 @@ def extract_unique_cves_from_csv(csv_path: Path, cve_column: str = "service.cves
                 f"Column '{cve_column}' not found in CSV. Available columns: {', '.join(reader.fieldnames)}"
             )
 
-        for row in reader:
-            cell = (row.get(cve_column) or "").strip()
+        skipped = 0
+        while True:
+            try:
+                row = next(reader)
+            except StopIteration:
+                break
+            except csv.Error as e:
+                # a field above csv.field_size_limit (100 MB); the reader resumes on the next line
+                skipped += 1
+                print(f"[WARN] {csv_path.name}: {e} → row skipped")
+                continue
+            cell = (row.get(cve_column) or "")[:MAX_CVE_CELL_CHARS]
             if not cell:
                 continue
-            for m in CVE_RE.finditer(cell):
-                found.add(m.group(0).upper())
+            found.update(m.upper() for m in CVE_RE.findall(cell))
+
+        if skipped:
+            print(f"[WARN] Skipped {skipped} unreadable rows in '{csv_path.name}'")
 
     return sorted(found)
 
 
-def load_existing_jsonl(jsonl_path: Path) -> Dict[str, Dict[str, Any]]:
-    records: Dict[str, Dict[str, Any]] = {}
+def iter_existing_jsonl(jsonl_path: Path, skip_ids: Optional[Set[str]] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    (cve_id, normalized record) per usable line; later lines for the same CVE come later.
+    Lines that open with a "cve_id"/"cveId" in skip_ids are dropped without decoding the payload.
+    """
     if not jsonl_path.exists():
-        return records
+        return
+
+    is_zst = jsonl_path.suffix == ".zst"
+    if is_zst and not ZSTD_AVAILABLE:
+        print(f"[WARN] {jsonl_path.name} is zstd-compressed but zstandard is not installed; skipping it")
+        return
 
-    with jsonl_path.open("r", encoding="utf-8") as f:
+    with jsonl_path.open("rb") as raw:
+        f = io.BufferedReader(zstd.ZstdDecompressor().stream_reader(raw)) if is_zst else raw
         for line_no, line in enumerate(f, start=1):
-            line = line.strip()
-            if not line:
-                continue
+            if skip_ids:
+                m = _JSONL_ID_PREFIX_RE.match(line)
+                if m and m.group(1).decode("ascii", "replace").strip().upper() in skip_ids:
+                    continue
             try:
-                obj = json.loads(line)
-            except json.JSONDecodeError:
-                # keep going; malformed line shouldn't break the run
+                obj = loads(line)  # surrounding whitespace is accepted by both parsers
+            except ValueError:  # json.JSONDecodeError / orjson.JSONDecodeError
+                # keep going; blank or malformed line shouldn't break the run
                 continue
 
             # Try multiple known shapes:
@@ -128,17 +301,96 @@ def load_existing_jsonl(jsonl_path: Path) -> Dict[str, Dict[str, Any]]:
                         "nvd": pseudo_nvd,
                         "nvd_metrics": extract_nvd_metrics(pseudo_nvd),
                     }
-                records[cve] = obj
+                yield cve, obj
+
+
+def jsonl_writer(raw, path: Path):
+    """Context manager writing JSONL bytes to the open file `raw`; zstd-framed when `path` is .zst."""
+    if path.suffix == ".zst":
+        return zstd.ZstdCompressor(level=ZSTD_LEVEL, threads=-1).stream_writer(raw, closefd=False)
+    return contextlib.nullcontext(raw)
 
-    return records
 
+def open_record_store(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(str(path))
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS cves ("
+        "cve_id TEXT PRIMARY KEY, fetched_at TEXT, record TEXT, has_cvss INTEGER)"
+    )
+    if "has_cvss" not in {row[1] for row in conn.execute("PRAGMA table_info(cves)")}:
+        # store created before the summary column existed; load_records backfills it
+        conn.execute("ALTER TABLE cves ADD COLUMN has_cvss INTEGER")
+    conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    return conn
+
+
+def file_stamp(path: Path) -> str:
+    st = path.stat()
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+def store_meta_get(conn: sqlite3.Connection, key: str) -> Optional[str]:
+    row = conn.execute("SELECT value FROM meta WHERE key=?", (key,)).fetchone()
+    return row[0] if row else None
 
-def write_jsonl_atomic(path: Path, records_by_cve: Dict[str, Dict[str, Any]]) -> None:
-    tmp = path.with_suffix(path.suffix + ".tmp")
-    with tmp.open("w", encoding="utf-8") as f:
-        for cve in sorted(records_by_cve.keys()):
-            f.write(json.dumps(records_by_cve[cve], ensure_ascii=False) + "\n")
-    tmp.replace(path)
+
+def store_meta_set(conn: sqlite3.Connection, key: str, value: str) -> None:
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+
+def store_upsert(conn: sqlite3.Connection, record: Dict[str, Any]) -> None:
+    conn.execute(
+        "INSERT OR REPLACE INTO cves (cve_id, fetched_at, record, has_cvss) VALUES (?, ?, ?, ?)",
+        (record["cve_id"], record.get("fetched_at"), dumps_bytes(record), int(nvd_has_any_cvss_metric(record))),
+    )
+
+
+def iter_store_records(conn: sqlite3.Connection) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    for cve_id, raw in conn.execute("SELECT cve_id, record FROM cves ORDER BY cve_id"):
+        yield cve_id, loads(raw)
+
+
+def summarize_record(rec: Dict[str, Any]) -> Dict[str, Any]:
+    """The fields main() needs for the freshness/CVSS checks; the full NVD payload stays in the store."""
+    return {"fetched_at": rec.get("fetched_at"), "has_cvss": nvd_has_any_cvss_metric(rec)}
+
+
+def load_records(store: sqlite3.Connection, jsonl_path: Path) -> Dict[str, Dict[str, Any]]:
+    """
+    Merge the SQLite store with the exported JSONL into slim summaries (see summarize_record).
+    The store is written on every fetch, so it wins on conflicts; JSONL-only records (older runs)
+    are seeded into the store. A JSONL that is still exactly our last export is not parsed again.
+    """
+    # Summaries come straight from the columns; only rows without has_cvss are decoded
+    summaries: Dict[str, Dict[str, Any]] = {}
+    backfill: List[str] = []
+    for cve_id, fetched_at, has_cvss in store.execute("SELECT cve_id, fetched_at, has_cvss FROM cves"):
+        if has_cvss is None:
+            backfill.append(cve_id)
+        else:
+            summaries[cve_id] = {"fetched_at": fetched_at, "has_cvss": bool(has_cvss)}
+    if backfill:
+        with store:
+            for cve_id in backfill:
+                (rec_json,) = store.execute("SELECT record FROM cves WHERE cve_id=?", (cve_id,)).fetchone()
+                summary = summarize_record(loads(rec_json))
+                store.execute("UPDATE cves SET has_cvss=? WHERE cve_id=?", (int(summary["has_cvss"]), cve_id))
+                summaries[cve_id] = summary
+
+    if jsonl_path.exists() and store_meta_get(store, "jsonl_export") == file_stamp(jsonl_path):
+        return summaries
+
+    stored_ids = set(summaries)
+    with store:
+        for cve_id, rec in iter_existing_jsonl(jsonl_path, skip_ids=stored_ids):
+            if cve_id in stored_ids:
+                continue
+            # INSERT OR REPLACE: a later line for the same CVE wins, as before
+            store_upsert(store, {**rec, "cve_id": cve_id})
+            summaries[cve_id] = summarize_record(rec)
+    return summaries
 
 
 def extract_nvd_metrics(nvd_json: Dict[str, Any]) -> Dict[str, Any]:
@@ -149,29 +401,145 @@ def extract_nvd_metrics(nvd_json: Dict[str, Any]) -> Dict[str, Any]:
     return cve.get("metrics", {}) or {}
 
 
-def fetch_nvd_cve(
-    cve_id: str,
-    *,
-    api_key: str = "",
-    user_agent: str = DEFAULT_USER_AGENT,
-    request_delay_sec: float = DEFAULT_REQUEST_DELAY_SEC,
-    retry_limit: int = DEFAULT_RETRY_LIMIT,
-    backoff_multiplier: float = DEFAULT_BACKOFF_MULTIPLIER,
-) -> Optional[Dict[str, Any]]:
+def open_cache(path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(str(path))
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS cve_cache ("
+        "cve_id TEXT PRIMARY KEY, fetched_at INTEGER, payload BLOB)"
+    )
+    return conn
 
-    url = NVD_API_BASE + cve_id
+
+def cache_get(
+    conn: Optional[sqlite3.Connection], cve_id: str, ttl_sec: float
+) -> Optional[Tuple[Dict[str, Any], str]]:
+    """(payload, ISO time it was fetched from NVD) for a cached response younger than ttl_sec, else None."""
+    if conn is None or ttl_sec <= 0:
+        return None
+    row = conn.execute(
+        "SELECT payload, fetched_at FROM cve_cache WHERE cve_id=? AND fetched_at > ?",
+        (cve_id, int(time.time() - ttl_sec)),
+    ).fetchone()
+    if row is None:
+        return None
+    try:
+        return loads(zlib.decompress(row[0])), datetime.fromtimestamp(row[1], timezone.utc).isoformat()
+    except (zlib.error, ValueError):
+        # corrupt entry → treat as a miss, it gets overwritten on the next fetch
+        return None
+
+
+def cache_put(conn: Optional[sqlite3.Connection], cve_id: str, data: Dict[str, Any]) -> None:
+    # Not committed here; callers commit at checkpoint time so writes batch into one transaction
+    if conn is None:
+        return
+    conn.execute(
+        "INSERT OR REPLACE INTO cve_cache (cve_id, fetched_at, payload) VALUES (?, ?, ?)",
+        (cve_id, int(time.time()), zlib.compress(dumps_bytes(data))),
+    )
+
+
+def cache_drop(conn: Optional[sqlite3.Connection], cve_ids: Iterable[str]) -> None:
+    """Evict cached payloads so the next lookup for these ids goes back to NVD."""
+    if conn is None:
+        return
+    conn.executemany("DELETE FROM cve_cache WHERE cve_id=?", ((c,) for c in cve_ids))
+    conn.commit()
+
+
+def nvd_headers(api_key: str = "", user_agent: str = DEFAULT_USER_AGENT) -> Dict[str, str]:
     headers = {"User-Agent": user_agent}
     if api_key:
         headers["apiKey"] = api_key
+    return headers
+
+
+def make_session(api_key: str = "", user_agent: str = DEFAULT_USER_AGENT) -> requests.Session:
+    """
+    Keep-alive session so fetches reuse TLS connections to NVD. Retries are not done by the
+    adapter but by nvd_get_json, so that every attempt goes through the rate limiter.
+    """
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=32, max_retries=0))
+    session.headers.update(nvd_headers(api_key, user_agent))
+    return session
 
+
+def retry_wait(delay: float, headers: Any = None) -> float:
+    """Seconds to wait before the next attempt: the backoff delay, or longer if Retry-After asks for it."""
+    value = headers.get("Retry-After") if headers is not None else None
+    if value:
+        try:
+            return max(delay, float(value))
+        except ValueError:
+            try:
+                return max(delay, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+            except (TypeError, ValueError):
+                pass
+    return delay
+
+
+# ──────────────────────────────────────────────────────────────
+# RATE LIMITER (shared by all requests of a run)
+# ──────────────────────────────────────────────────────────────
+class RateLimiter:
+    """Thread-safe token bucket: at most `rate` requests per `per` seconds."""
+
+    def __init__(self, rate: float, per: float = 1.0):
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.fill_rate = rate / per
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _take(self) -> float:
+        """Take a token and return 0, or return how long to wait for the next one."""
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.fill_rate)
+            self.last = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.fill_rate
+
+    def acquire(self) -> None:
+        while (wait := self._take()) > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self) -> None:
+        while (wait := self._take()) > 0:
+            await asyncio.sleep(wait)
+
+
+def make_limiter(api_key: str = "") -> RateLimiter:
+    return RateLimiter(NVD_RATE_WITH_KEY if api_key else NVD_RATE_NO_KEY, per=NVD_RATE_WINDOW_SEC)
+
+
+def nvd_get_json(
+    session: requests.Session,
+    url: str,
+    label: str,
+    *,
+    limiter: Optional[RateLimiter] = None,
+    request_delay_sec: float = DEFAULT_REQUEST_DELAY_SEC,
+    retry_limit: int = DEFAULT_RETRY_LIMIT,
+    backoff_multiplier: float = DEFAULT_BACKOFF_MULTIPLIER,
+) -> Optional[Dict[str, Any]]:
+    """
+    GET an NVD URL; network errors and RETRY_STATUS_CODES are retried with backoff (honouring
+    Retry-After), each attempt taking a limiter token. `label` names the request in log lines.
+    """
     delay = request_delay_sec
 
     for attempt in range(1, retry_limit + 1):
+        if limiter is not None:
+            limiter.acquire()
         try:
-            r = requests.get(url, headers=headers, timeout=45)
+            r = session.get(url, timeout=45)
         except requests.RequestException as e:
             # transient network issue
-            print(f"[NET] {cve_id}: {e} → wait {delay:.2f}s (attempt {attempt}/{retry_limit})")
+            print(f"[NET] {label}: {e} → wait {delay:.2f}s (attempt {attempt}/{retry_limit})")
             time.sleep(delay)
             delay *= backoff_multiplier
             continue
@@ -180,69 +548,329 @@ def fetch_nvd_cve(
             try:
                 return r.json()
             except json.JSONDecodeError:
-                print(f"[JSON] {cve_id}: invalid JSON")
+                print(f"[JSON] {label}: invalid JSON")
                 return None
 
-        if r.status_code == 429:
-            print(f"[429] {cve_id}: rate limited → wait {delay:.2f}s (attempt {attempt}/{retry_limit})")
-            time.sleep(delay)
+        if r.status_code in RETRY_STATUS_CODES:
+            wait = retry_wait(delay, r.headers)
+            reason = "rate limited" if r.status_code == 429 else "server error"
+            print(f"[{r.status_code}] {label}: {reason} → wait {wait:.2f}s (attempt {attempt}/{retry_limit})")
+            time.sleep(wait)
             delay *= backoff_multiplier
             continue
 
         # Other HTTP errors: don't keep hammering
-        print(f"[HTTP {r.status_code}] {cve_id}: {r.text[:200].strip()}")
+        print(f"[HTTP {r.status_code}] {label}: {r.text[:200].strip()}")
         return None
 
-    print(f"[FAIL] {cve_id}: max retries hit")
+    print(f"[FAIL] {label}: max retries hit")
     return None
 
 
-def records_to_flat_rows(records_by_cve: Dict[str, Dict[str, Any]]) -> List[Dict[str, Any]]:
-    rows: List[Dict[str, Any]] = []
+def _nvd_ts(dt: datetime) -> str:
+    return dt.strftime("%Y-%m-%dT%H:%M:%S.") + f"{dt.microsecond // 1000:03d}"
 
-    for cve_id in sorted(records_by_cve.keys()):
-        rec = records_by_cve[cve_id]
-        nvd = (rec.get("nvd") or {})
-        vulns = nvd.get("vulnerabilities") or []
-        cve_obj = ((vulns[0] or {}).get("cve") or {}) if vulns else {}
 
-        published = cve_obj.get("published")
-        last_modified = cve_obj.get("lastModified")
+def iter_pub_windows(year: int) -> Iterator[Tuple[str, str]]:
+    """(pubStartDate, pubEndDate) pairs covering `year` in windows the API accepts."""
+    start = datetime(year, 1, 1)
+    year_end = datetime(year + 1, 1, 1)
+    while start < year_end:
+        end = min(start + timedelta(days=NVD_BULK_MAX_WINDOW_DAYS), year_end)
+        yield _nvd_ts(start), _nvd_ts(end - timedelta(milliseconds=1))
+        start = end
 
-        # description (prefer EN)
-        desc = None
-        for d in (cve_obj.get("descriptions") or []):
-            if isinstance(d, dict) and d.get("lang") == "en" and d.get("value"):
-                desc = d.get("value")
-                break
-        if not desc:
-            for d in (cve_obj.get("descriptions") or []):
-                if isinstance(d, dict) and d.get("value"):
-                    desc = d.get("value")
+
+def fetch_nvd_bulk(
+    wanted: Set[str],
+    *,
+    session: requests.Session,
+    limiter: Optional[RateLimiter] = None,
+    request_delay_sec: float = DEFAULT_REQUEST_DELAY_SEC,
+    retry_limit: int = DEFAULT_RETRY_LIMIT,
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Yield (cve_id, single-CVE NVD response) for wanted CVEs found by paging through the publication
+    windows of their CVE-ID year. Only years with >= BULK_MIN_PER_YEAR wanted CVEs are walked;
+    CVEs published outside their ID year are simply not yielded and fall back to per-CVE lookups.
+    """
+    by_year: Dict[int, Set[str]] = defaultdict(set)
+    for cve in wanted:
+        by_year[int(cve.split("-")[1])].add(cve)
+
+    for year, cves in sorted(by_year.items()):
+        if len(cves) < BULK_MIN_PER_YEAR:
+            continue
+        print(f"[BULK] {year}: {len(cves)} wanted CVEs → paging publication windows")
+        for pub_start, pub_end in iter_pub_windows(year):
+            start_index = 0
+            while True:
+                url = (
+                    f"{NVD_API_ROOT}?pubStartDate={pub_start}&pubEndDate={pub_end}"
+                    f"&resultsPerPage={NVD_BULK_PAGE_SIZE}&startIndex={start_index}"
+                )
+                page = nvd_get_json(
+                    session, url, f"{pub_start[:10]}..{pub_end[:10]} @{start_index}",
+                    limiter=limiter, request_delay_sec=request_delay_sec, retry_limit=retry_limit,
+                )
+                vulns = (page or {}).get("vulnerabilities") or []
+                if not vulns:
+                    break
+                # Same envelope as a ?cveId= response, so downstream parsing is unchanged
+                envelope = {k: v for k, v in page.items() if k != "vulnerabilities"}
+                envelope.update(resultsPerPage=1, startIndex=0, totalResults=1)
+                for item in vulns:
+                    cve_id = str(((item or {}).get("cve") or {}).get("id", "")).upper()
+                    if cve_id in cves:
+                        yield cve_id, {**envelope, "vulnerabilities": [item]}
+                start_index += len(vulns)
+                if start_index >= (page.get("totalResults") or 0):
                     break
 
-        metrics = rec.get("nvd_metrics") or {}
-        metrics_json = json.dumps(metrics, ensure_ascii=False)
 
-        rows.append({
-            "cve_id": cve_id,
-            "published": published,
-            "lastModified": last_modified,
-            "nvd_metrics_json": metrics_json,
-            "description_en": desc,
-        })
+async def _async_get(client: Any, url: str) -> Tuple[int, Any, bytes]:
+    """GET via either async client (httpx.AsyncClient or aiohttp.ClientSession) -> (status, headers, body)."""
+    if HTTPX_AVAILABLE and isinstance(client, httpx.AsyncClient):
+        r = await client.get(url)
+        return r.status_code, r.headers, r.content
+    async with client.get(url) as r:
+        return r.status, r.headers, await r.read()
 
-    return rows
 
+async def fetch_nvd_cve_async(
+    session: Any,
+    sem: asyncio.Semaphore,
+    cve_id: str,
+    *,
+    request_delay_sec: float = DEFAULT_REQUEST_DELAY_SEC,
+    retry_limit: int = DEFAULT_RETRY_LIMIT,
+    backoff_multiplier: float = DEFAULT_BACKOFF_MULTIPLIER,
+    cache: Optional[sqlite3.Connection] = None,
+    limiter: Optional[RateLimiter] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Async per-CVE counterpart of nvd_get_json; headers live on the session, concurrency is capped by sem.
+    Always asks NVD (cache hits are resolved by the caller); a good response is written to `cache`.
+    """
+    url = NVD_API_BASE + cve_id
+    delay = request_delay_sec
 
-def write_csv(path: Path, rows: List[Dict[str, Any]]) -> None:
-    if not rows:
-        return
-    fieldnames = list(rows[0].keys())
+    for attempt in range(1, retry_limit + 1):
+        async with sem:
+            if limiter is not None:
+                await limiter.acquire_async()
+            try:
+                status, headers, raw = await _async_get(session, url)
+            except ASYNC_NET_ERRORS as e:
+                # transient network issue
+                print(f"[NET] {cve_id}: {e!r} → wait {delay:.2f}s (attempt {attempt}/{retry_limit})")
+                await asyncio.sleep(delay)
+                delay *= backoff_multiplier
+                continue
+
+        if status == 200:
+            try:
+                data = loads(raw)
+            except ValueError:
+                print(f"[JSON] {cve_id}: invalid JSON")
+                return None
+            cache_put(cache, cve_id, data)
+            return data
+
+        if status in RETRY_STATUS_CODES:
+            # same policy as nvd_get_json: 429/5xx retried, Retry-After honoured
+            wait = retry_wait(delay, headers)
+            reason = "rate limited" if status == 429 else "server error"
+            print(f"[{status}] {cve_id}: {reason} → wait {wait:.2f}s (attempt {attempt}/{retry_limit})")
+            await asyncio.sleep(wait)
+            delay *= backoff_multiplier
+            continue
+
+        # Other HTTP errors: don't keep hammering
+        body = raw[:200].decode("utf-8", "replace").strip()
+        print(f"[HTTP {status}] {cve_id}: {body}")
+        return None
+
+    print(f"[FAIL] {cve_id}: max retries hit")
+    return None
+
+
+def open_async_client(headers: Dict[str, str], concurrency: int) -> Any:
+    """HTTP/2 httpx client when available (streams share one connection), else aiohttp."""
+    if HTTPX_AVAILABLE:
+        return httpx.AsyncClient(
+            http2=True,
+            headers=headers,
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            timeout=45,
+        )
+    connector = aiohttp.TCPConnector(limit_per_host=concurrency)
+    timeout = aiohttp.ClientTimeout(total=45)
+    return aiohttp.ClientSession(headers=headers, connector=connector, timeout=timeout)
+
+
+async def run_fetch(
+    to_fetch: List[str],
+    on_result: Callable[[int, str, Optional[Dict[str, Any]]], None],
+    *,
+    api_key: str = "",
+    user_agent: str = DEFAULT_USER_AGENT,
+    concurrency: int = DEFAULT_CONCURRENCY,
+    request_delay_sec: float = DEFAULT_REQUEST_DELAY_SEC,
+    retry_limit: int = DEFAULT_RETRY_LIMIT,
+    cache: Optional[sqlite3.Connection] = None,
+    limiter: Optional[RateLimiter] = None,
+) -> None:
+    """Fetch all CVEs concurrently; on_result(idx, cve, data) is called in completion order."""
+    headers = nvd_headers(api_key, user_agent)
+    if limiter is None:
+        limiter = make_limiter(api_key)
+
+    sem = asyncio.Semaphore(concurrency)
+
+    async with open_async_client(headers, concurrency) as session:
+        async def one(cve: str):
+            data = await fetch_nvd_cve_async(
+                session, sem, cve,
+                request_delay_sec=request_delay_sec,
+                retry_limit=retry_limit,
+                cache=cache,
+                limiter=limiter,
+            )
+            return cve, data
+
+        # dict.fromkeys: duplicate ids would otherwise run as separate in-flight requests
+        tasks = [asyncio.ensure_future(one(cve)) for cve in dict.fromkeys(to_fetch)]
+        for idx, fut in enumerate(asyncio.as_completed(tasks), start=1):
+            cve, data = await fut
+            on_result(idx, cve, data)
+
+
+def flat_row(cve_id: str, rec: Dict[str, Any]) -> Tuple[Any, ...]:
+    nvd = (rec.get("nvd") or {})
+    vulns = nvd.get("vulnerabilities") or []
+    cve_obj = ((vulns[0] or {}).get("cve") or {}) if vulns else {}
+
+    published = cve_obj.get("published")
+    last_modified = cve_obj.get("lastModified")
+
+    # description (prefer EN, else the first non-empty one) in a single pass
+    desc = None
+    fallback = None
+    for d in cve_obj.get("descriptions") or ():
+        if not isinstance(d, dict):
+            continue
+        v = d.get("value")
+        if not v:
+            continue
+        if d.get("lang") == "en":
+            desc = v
+            break
+        if fallback is None:
+            fallback = v
+    desc = desc or fallback
+
+    metrics_json = _encode_metrics_json(rec.get("nvd_metrics") or {})
+
+    return (cve_id, published, last_modified, metrics_json, desc)
+
+
+def fetch_threaded(
+    to_fetch: List[str],
+    on_result: Callable[[int, str, Optional[Dict[str, Any]]], None],
+    *,
+    session: requests.Session,
+    limiter: Optional[RateLimiter] = None,
+    workers: int = DEFAULT_CONCURRENCY,
+    request_delay_sec: float = DEFAULT_REQUEST_DELAY_SEC,
+    retry_limit: int = DEFAULT_RETRY_LIMIT,
+    cache: Optional[sqlite3.Connection] = None,
+) -> None:
+    """
+    requests fallback for run_fetch: worker threads fetch and push (cve, data) onto a bounded queue,
+    the calling thread drains it. Cache writes and on_result stay on the calling thread because
+    SQLite connections may only be used by the thread that opened them.
+    """
+    idx = 0
+    pending = list(dict.fromkeys(to_fetch))
+
+    results: "queue.Queue[Tuple[str, Optional[Dict[str, Any]]]]" = queue.Queue(maxsize=FETCH_QUEUE_SIZE)
+
+    def work(cve: str) -> None:
+        data = None
+        try:
+            data = nvd_get_json(
+                session, NVD_API_BASE + cve, cve,
+                limiter=limiter, request_delay_sec=request_delay_sec, retry_limit=retry_limit,
+            )
+        finally:
+            results.put((cve, data))  # always exactly one message per CVE, even on a crash
+
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        for cve in pending:
+            ex.submit(work, cve)
+        for _ in range(len(pending)):
+            cve, data = results.get()
+            if data is not None:
+                cache_put(cache, cve, data)
+            idx += 1
+            on_result(idx, cve, data)
+
+
+def records_to_flat_rows(records: Iterable[Tuple[str, Dict[str, Any]]]) -> Iterator[Tuple[Any, ...]]:
+    """records: (cve_id, record) pairs, already in output order. Yields tuples in CSV_FIELDNAMES order."""
+    for cve_id, rec in records:
+        yield flat_row(cve_id, rec)
+
+
+def write_csv(path: Path, rows: Iterable[Tuple[Any, ...]]) -> int:
+    """Stream rows to CSV and return how many were written; no file is created when there are none."""
+    rows = iter(rows)
+    first = next(rows, None)
+    if first is None:
+        return 0
+    n = 1
     with path.open("w", encoding="utf-8", newline="") as f:
-        w = csv.DictWriter(f, fieldnames=fieldnames)
-        w.writeheader()
-        w.writerows(rows)
+        w = csv.writer(f)
+        w.writerow(CSV_FIELDNAMES)
+        w.writerow(first)
+        while True:
+            batch = list(itertools.islice(rows, EXPORT_BATCH_ROWS))
+            if not batch:
+                break
+            w.writerows(batch)
+            n += len(batch)
+    return n
+
+
+def write_outputs_atomic(jsonl_path: Path, csv_path: Path, store: sqlite3.Connection) -> int:
+    """
+    Export the record store in one cve_id-ordered pass: the stored JSON bytes go to the JSONL as-is
+    and the CSV row is built from the same record. Both files are replaced atomically; returns the
+    number of records (no CSV is written when there are none, as in write_csv).
+    """
+    jsonl_tmp = jsonl_path.with_suffix(jsonl_path.suffix + ".tmp")
+    csv_tmp = csv_path.with_suffix(csv_path.suffix + ".tmp")
+    n = 0
+    with jsonl_tmp.open("wb") as raw, jsonl_writer(raw, jsonl_path) as out, \
+            csv_tmp.open("w", encoding="utf-8", newline="") as f_csv:
+        w = csv.writer(f_csv)
+        w.writerow(CSV_FIELDNAMES)
+        cur = store.execute("SELECT cve_id, record FROM cves ORDER BY cve_id")
+        while True:
+            batch = cur.fetchmany(EXPORT_BATCH_ROWS)
+            if not batch:
+                break
+            blobs = [r.encode("utf-8") if isinstance(r, str) else r for _, r in batch]
+            out.write(b"\n".join(blobs) + b"\n")
+            w.writerows([flat_row(cve_id, loads(raw)) for (cve_id, _), raw in zip(batch, blobs)])
+            n += len(batch)
+    jsonl_tmp.replace(jsonl_path)
+    if n:
+        csv_tmp.replace(csv_path)
+    else:
+        csv_tmp.unlink()
+    return n
 
 
 def prompt_yes_no(question: str, default_no: bool = True) -> bool:
@@ -258,6 +886,11 @@ def prompt_yes_no(question: str, default_no: bool = True) -> bool:
 def parse_iso_dt(value: Any) -> Optional[datetime]:
     if not value:
         return None
+    if CISO8601_AVAILABLE:
+        try:
+            return ciso8601.parse_datetime(value)  # accepts a trailing "Z" as-is
+        except (TypeError, ValueError):
+            pass  # not a str, or a form only fromisoformat knows
     try:
         return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
     except Exception:
@@ -268,18 +901,16 @@ def nvd_has_any_cvss_metric(rec: Dict[str, Any]) -> bool:
     metrics = rec.get("nvd_metrics")
     if not isinstance(metrics, dict):
         # fallback: try inside embedded NVD payload
-        nvd = rec.get("nvd") if isinstance(rec.get("nvd"), dict) else {}
-        vulns = nvd.get("vulnerabilities") or []
-        cve = ((vulns[0] or {}).get("cve") or {}) if vulns else {}
-        metrics = cve.get("metrics") or {}
+        nvd = rec.get("nvd")
+        metrics = extract_nvd_metrics(nvd) if isinstance(nvd, dict) else {}
 
     if not isinstance(metrics, dict) or not metrics:
         return False
 
     # If any known metric family exists and is a non-empty list → considered “filled”
-    for k in ("cvssMetricV2", "cvssMetricV30", "cvssMetricV31", "cvssMetricV40"):
+    for k in CVSS_METRIC_KEYS:
         v = metrics.get(k)
-        if isinstance(v, list) and len(v) > 0:
+        if v and isinstance(v, list):
             return True
 
     return False
@@ -291,16 +922,25 @@ def main() -> None:
         description="Extract CVEs from Modat service CSV (service.cves) and fetch NVD details (JSONL + CSV)."
     )
     ap.add_argument("--input", type=str, default=str(DEFAULT_INPUT_CSV), help="Path to modat_service_all.csv")
-    ap.add_argument("--delay", type=float, default=DEFAULT_REQUEST_DELAY_SEC, help="Base delay between requests.")
+    ap.add_argument("--delay", type=float, default=DEFAULT_REQUEST_DELAY_SEC, help="Initial wait before retrying a 429/network error.")
     ap.add_argument("--retry", type=int, default=DEFAULT_RETRY_LIMIT, help="Retry limit for 429/timeouts.")
+    ap.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                    help="Max concurrent NVD requests (aiohttp tasks or worker threads).")
+    ap.add_argument("--cache-ttl-hours", type=float, default=DEFAULT_CACHE_TTL_HOURS,
+                    help="Reuse cached NVD responses younger than this (0 disables the cache).")
+    ap.add_argument("--bulk", action="store_true",
+                    help="Page through publication-date windows for CVE years with many wanted CVEs.")
     args = ap.parse_args()
 
     input_csv = Path(args.input)
     out_dir = input_csv.parent
 
     out_txt = out_dir / "cve_from_modat_service_api.txt"
-    out_jsonl = out_dir / "cve_details_nvd_full.jsonl"
+    out_jsonl_plain = out_dir / "cve_details_nvd_full.jsonl"
+    out_jsonl = out_dir / "cve_details_nvd_full.jsonl.zst" if ZSTD_AVAILABLE else out_jsonl_plain
     out_csv = out_dir / "cve_details_nvd_full.csv"
+    out_db = out_dir / "cve_details_nvd_full.sqlite3"
+    cache_path = out_dir / NVD_CACHE_FILENAME
 
     # 1) Extract CVEs from service.cves and write TXT
     cves = extract_unique_cves_from_csv(input_csv, cve_column="service.cves")
@@ -312,8 +952,10 @@ def main() -> None:
         print("[INFO] No CVEs found. Exiting.")
         return
 
-    # 2) Load existing JSONL (if any)
-    existing = load_existing_jsonl(out_jsonl)
+    # 2) Load existing records (SQLite store + JSONL, if any)
+    store = open_record_store(out_db)
+    # Fall back to a plain JSONL from earlier runs until the first .zst export exists
+    existing = load_records(store, out_jsonl if out_jsonl.exists() else out_jsonl_plain)
     existing_set = set(existing.keys())
 
     # ── Age/quality checks on existing records ─────────────────────────
@@ -325,8 +967,8 @@ def main() -> None:
     older_than_month: Set[str] = set()
     missing_cvss: Set[str] = set()
 
-    for cve_id, rec in existing.items():
-        dt = parse_iso_dt(rec.get("fetched_at"))
+    for cve_id, summary in existing.items():
+        dt = parse_iso_dt(summary["fetched_at"])
         if dt:
             ts = dt.timestamp()
             if ts < week_ago:
@@ -334,7 +976,7 @@ def main() -> None:
             if ts < month_ago:
                 older_than_month.add(cve_id)
 
-        if not nvd_has_any_cvss_metric(rec):
+        if not summary["has_cvss"]:
             missing_cvss.add(cve_id)
 
     print("\n=== Data freshness / completeness ===")
@@ -400,13 +1042,15 @@ def main() -> None:
         base_to_fetch = set(cves if refresh_all else new_missing)
         to_fetch = sorted(base_to_fetch | rescan_set)
 
+    # One NVD round trip per CVE: drop any repeated/mixed-case ids (order preserved)
+    to_fetch = list(dict.fromkeys(c.upper() for c in to_fetch))
 
     if not to_fetch:
         print("[INFO] Nothing to fetch (all CVEs are already present).")
         # Still (re)write CSV alongside JSONL to satisfy the requirement.
-        rows = records_to_flat_rows(existing)
-        write_csv(out_csv, rows)
-        print(f"[OK] Wrote CSV → {out_csv.name} ({len(rows)} rows)")
+        n_rows = write_csv(out_csv, records_to_flat_rows(iter_store_records(store)))
+        store.close()
+        print(f"[OK] Wrote CSV → {out_csv.name} ({n_rows} rows)")
         return
 
     api_key = input("Enter NVD API key (press Enter to continue without a key): ").strip()
@@ -423,47 +1067,114 @@ def main() -> None:
     print(f"API key    : {'provided' if api_key else 'not provided'}")
 
     # 4) Fetch loop with checkpointing
-    records_by_cve: Dict[str, Dict[str, Any]] = dict(existing)  # start with existing
     failed: List[str] = []
-
-    for idx, cve in enumerate(to_fetch, start=1):
-        print(f" → ({idx}/{len(to_fetch)}) querying {cve}")
-        data = fetch_nvd_cve(
-            cve,
+    cache_ttl_sec = args.cache_ttl_hours * 3600
+    cache = open_cache(cache_path) if cache_ttl_sec > 0 else None
+    # CVEs that already have a record are here because of "refresh all" or a rescan bucket; a cached
+    # copy of what we fetched last time would defeat that, so these always go back to NVD
+    refetch = [c for c in to_fetch if c in existing_set]
+    if refetch:
+        cache_drop(cache, refetch)
+
+    def handle_result(
+        idx: int, cve: str, data: Optional[Dict[str, Any]], fetched_at: Optional[str] = None
+    ) -> None:
+        if data is None:
+            failed.append(cve)
+        else:
+            record = {
+                "cve_id": cve,
+                # a cache hit keeps the time NVD actually served it
+                "fetched_at": fetched_at or utc_now_iso(),
+                "nvd": data,
+                "nvd_metrics": extract_nvd_metrics(data),
+            }
+
+            # Overwrite existing record for this CVE (ensures each CVE appears once)
+            store_upsert(store, record)
+
+        # Checkpoint every CHECKPOINT_EVERY completions (failed ones included) so resume works after interruption
+        if (idx % CHECKPOINT_EVERY) == 0:
+            store.commit()
+            if cache is not None:
+                cache.commit()
+            print(f"[CHECKPOINT] Committed {idx}/{len(to_fetch)} fetches → {out_db.name}")
+
+    # One token bucket and keep-alive session for every NVD request of this run
+    limiter = make_limiter(api_key)
+    session = make_session(api_key)
+
+    # Answer what we can from the cache first; only misses are sent to NVD
+    pending: List[str] = []
+    hits = 0
+    for cve in to_fetch:
+        cached = cache_get(cache, cve, cache_ttl_sec)
+        if cached is None:
+            pending.append(cve)
+        else:
+            hits += 1
+            handle_result(hits, cve, *cached)
+    if hits:
+        print(f"[INFO] {hits} CVEs answered from the response cache; {len(pending)} left to fetch")
+    to_fetch = pending
+
+    if args.bulk:
+        wanted = set(to_fetch)
+        got: Set[str] = set()
+        for cve, data in fetch_nvd_bulk(
+            wanted,
+            session=session,
+            limiter=limiter,
+            request_delay_sec=args.delay,
+            retry_limit=args.retry,
+        ):
+            cache_put(cache, cve, data)
+            got.add(cve)
+            handle_result(len(got), cve, data)
+        to_fetch = [c for c in to_fetch if c not in got]
+        print(f"[INFO] Bulk windows returned {len(got)} CVEs; {len(to_fetch)} left for per-CVE lookups")
+
+    if HTTPX_AVAILABLE or AIOHTTP_AVAILABLE:
+        client_name = "httpx (HTTP/2)" if HTTPX_AVAILABLE else "aiohttp"
+        print(f"[INFO] Fetching with {client_name} (concurrency={args.concurrency})")
+        asyncio.run(run_fetch(
+            to_fetch,
+            handle_result,
             api_key=api_key,
+            concurrency=max(1, args.concurrency),
+            request_delay_sec=args.delay,
             retry_limit=args.retry,
+            cache=cache,
+            limiter=limiter,
+        ))
+    else:
+        print(f"[INFO] httpx/aiohttp not installed; fetching with {args.concurrency} requests worker threads")
+        fetch_threaded(
+            to_fetch,
+            handle_result,
+            session=session,
+            limiter=limiter,
+            workers=max(1, args.concurrency),
             request_delay_sec=args.delay,
+            retry_limit=args.retry,
+            cache=cache,
         )
+    session.close()
 
-        if data is None:
-            failed.append(cve)
-            continue
+    if cache is not None:
+        cache.commit()
+        cache.close()
 
-        record = {
-            "cve_id": cve,
-            "fetched_at": utc_now_iso(),
-            "nvd": data,
-            "nvd_metrics": extract_nvd_metrics(data),
-        }
+    store.commit()
 
-        # Overwrite existing record for this CVE (ensures each CVE appears once)
-        records_by_cve[cve] = record
+    # Final write (JSONL + CSV are exports of the record store)
+    n_rows = write_outputs_atomic(out_jsonl, out_csv, store)
+    store_meta_set(store, "jsonl_export", file_stamp(out_jsonl))
+    store.commit()
+    store.close()
 
-        # Checkpoint periodically so resume works after interruption
-        if (idx % CHECKPOINT_EVERY) == 0:
-            write_jsonl_atomic(out_jsonl, records_by_cve)
-            # Always keep CSV next to JSONL (required)
-            rows = records_to_flat_rows(records_by_cve)
-            write_csv(out_csv, rows)
-            print(f"[CHECKPOINT] Wrote {len(records_by_cve)} records → {out_jsonl.name} + {out_csv.name}")
-
-    # Final write
-    write_jsonl_atomic(out_jsonl, records_by_cve)
-    rows = records_to_flat_rows(records_by_cve)
-    write_csv(out_csv, rows)
-
-    print(f"[OK] Wrote JSONL → {out_jsonl} ({len(records_by_cve)} unique CVEs)")
-    print(f"[OK] Wrote CSV  → {out_csv} ({len(rows)} rows)")
+    print(f"[OK] Wrote JSONL → {out_jsonl} ({n_rows} unique CVEs)")
+    print(f"[OK] Wrote CSV  → {out_csv} ({n_rows} rows)")
 
     # Failures
     if failed:
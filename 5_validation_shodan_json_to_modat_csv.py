@@ -16,11 +16,36 @@ Key Mappings:
 
 from __future__ import annotations
 
+import contextlib
 import csv
+import itertools
 import json
+import operator
+import os
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
+# Optional fast JSON backend; the stdlib json module is used when orjson is missing.
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Both accept bytes; orjson.JSONDecodeError subclasses json.JSONDecodeError, so the except clauses hold
+loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+
+# Optional Arrow CSV writer; quoting and UTF-8 encoding then run in C++ instead of csv.writer.
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
 # ============================================================
 # CONFIGURATION
 # ============================================================
@@ -32,23 +57,51 @@ INPUT_FILE = "5_shodan_20251109.json"  # <-- Replace with your actual filename
 
 OUTPUT_CSV = OUTPUT_DIR / "5_shodan_20251109.csv"  # Match the filename from your notebook
 
+# Parallel conversion: records are sent to worker processes in order-preserving blocks
+MIN_RECORDS_PER_WORKER = 2000   # below this a worker costs more in pickling than it saves
+POOL_BLOCK_RECORDS = 16384      # records read ahead per block (bounds memory for streamed JSONL)
+POOL_CHUNKSIZE = 256
+
+WRITE_BATCH_ROWS = 500          # rows per csv writerows() call
+ARROW_BATCH_ROWS = 8192         # rows per RecordBatch when pyarrow writes the CSV
+
 
 # ============================================================
 # UTILITIES
 # ============================================================
 
+# Vendor-specific Shodan objects: preserved as vendor.<name>.<key> columns and turned into tags
+VENDOR_FIELDS = ("hikvision", "dahua", "axis", "cisco", "apache", "nginx",
+                 "mobotix", "bosch", "honeywell", "genetec", "paxton", "nedap")
+UNTAGGED_VENDORS = frozenset({"nedap"})  # gets vendor columns but has never been emitted as a tag
+
+
+def present_vendors(shodan_record: dict) -> list[str]:
+    """VENDOR_FIELDS keys present in the record, in VENDOR_FIELDS order."""
+    return [vendor for vendor in VENDOR_FIELDS if vendor in shodan_record]
+
+
 def clean_for_csv(value) -> str:
     """Clean value for CSV output"""
-    if value is None:
+    # Plain str is by far the most common input; skip the isinstance chain for it
+    if type(value) is str:
+        text = value
+    elif value is None:
         return ""
-    if isinstance(value, bool):
+    elif isinstance(value, bool):
         return "true" if value else "false"
-    if isinstance(value, (int, float)):
+    elif isinstance(value, (int, float)):
         return str(value)
+    else:
+        text = str(value)
 
-    text = str(value)
-    # Normalize whitespace
-    text = text.replace("\r\n", " ").replace("\n", " ").replace("\r", " ").replace("\t", " ")
+    # Normalize whitespace; the `in` scans are cheap and most values contain none of these
+    if "\r" in text:
+        text = text.replace("\r\n", " ").replace("\r", " ")
+    if "\n" in text:
+        text = text.replace("\n", " ")
+    if "\t" in text:
+        text = text.replace("\t", " ")
     text = text.strip().strip('"').strip("'")
     return text
 
@@ -81,7 +134,7 @@ def extract_banner(shodan_record: dict) -> str:
     return ""
 
 
-def extract_tags(shodan_record: dict) -> str:
+def extract_tags(shodan_record: dict, vendors: list[str] | None = None) -> str:
     """
     Extract tags from Shodan record for tag-based detection.
     
@@ -99,12 +152,10 @@ def extract_tags(shodan_record: dict) -> str:
         product_tags = product.lower().replace("-", " ").replace("/", " ").split()
         tags.extend(product_tags)
     
-    # Add vendor-specific field names as tags
-    vendor_fields = ["hikvision", "dahua", "axis", "cisco", "apache", "nginx", 
-                     "mobotix", "bosch", "honeywell", "genetec", "paxton"]
-    for vendor in vendor_fields:
-        if vendor in shodan_record:
-            tags.append(vendor)
+    # Add vendor-specific field names as tags (vendors: present_vendors() result, if already known)
+    if vendors is None:
+        vendors = present_vendors(shodan_record)
+    tags.extend(vendor for vendor in vendors if vendor not in UNTAGGED_VENDORS)
     
     # Add protocol/transport info
     transport = shodan_record.get("transport", "")
@@ -186,7 +237,8 @@ def convert_shodan_to_detection_format(shodan_record: dict) -> dict[str, str]:
     
     # 2. Tags (CRITICAL for tag-based detection)
     # Create comma-separated tags from vendor fields and product
-    row["service.fingerprints.tags"] = extract_tags(shodan_record)
+    vendors = present_vendors(shodan_record)
+    row["service.fingerprints.tags"] = extract_tags(shodan_record, vendors)
     
     # 3. Banner (for banner-based detection)
     # Priority: http.server > data > product
@@ -234,18 +286,15 @@ def convert_shodan_to_detection_format(shodan_record: dict) -> dict[str, str]:
     # VENDOR-SPECIFIC FIELDS (preserve for analysis)
     # ========================================
     
-    vendor_fields = ["hikvision", "dahua", "axis", "cisco", "apache", "nginx",
-                     "mobotix", "bosch", "honeywell", "genetec", "paxton", "nedap"]
-    
-    for vendor in vendor_fields:
-        if vendor in shodan_record:
-            vendor_data = shodan_record[vendor]
-            if isinstance(vendor_data, dict):
-                for key, value in vendor_data.items():
-                    if isinstance(value, (dict, list)):
-                        row[f"vendor.{vendor}.{key}"] = clean_for_csv(json.dumps(value))
-                    else:
-                        row[f"vendor.{vendor}.{key}"] = clean_for_csv(value)
+    for vendor in vendors:
+        vendor_data = shodan_record[vendor]
+        if isinstance(vendor_data, dict):
+            prefix = f"vendor.{vendor}."
+            for key, value in vendor_data.items():
+                if isinstance(value, (dict, list)):
+                    row[f"{prefix}{key}"] = clean_for_csv(json.dumps(value))
+                else:
+                    row[f"{prefix}{key}"] = clean_for_csv(value)
     
     # ========================================
     # CVEs (for KEV calculation)
@@ -297,6 +346,65 @@ def convert_shodan_to_detection_format(shodan_record: dict) -> dict[str, str]:
 # PROCESSING
 # ============================================================
 
+def looks_like_jsonl(json_file: Path) -> bool:
+    """True when the first non-empty line is a complete record on its own (shodan download/parse output)."""
+    with json_file.open("rb") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                first = loads(line)
+            except json.JSONDecodeError:
+                return False
+            return isinstance(first, dict) and "matches" not in first
+    return False
+
+
+def iter_shodan_jsonl(json_file: Path):
+    """Yield one record per JSONL line without reading the whole file; bad lines are reported and skipped."""
+    with json_file.open("rb") as f:
+        for line_num, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield loads(line)
+            except json.JSONDecodeError:
+                print(f"[WARNING] Skipped invalid JSON at line {line_num}")
+
+
+def iter_spooled_batches(spool, reorder, width: int, batch_rows: int):
+    """Read back spooled rows in sorted header order, batch_rows at a time; short rows are padded to width."""
+    padding = [""] * width
+    spool.seek(0)
+    while True:
+        try:
+            rows = pickle.load(spool)
+        except EOFError:
+            return
+        for start in range(0, len(rows), batch_rows):
+            yield [reorder(row + padding[len(row):]) for row in rows[start:start + batch_rows]]
+
+
+def write_csv_stdlib(path: Path, headers: list[str], batches) -> None:
+    with path.open("w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL, lineterminator="\n")
+        writer.writerow(headers)
+        for batch in batches:
+            writer.writerows(batch)
+
+
+def write_csv_arrow(path: Path, headers: list[str], batches) -> None:
+    # Produces the same bytes as write_csv_stdlib: BOM, every value quoted, "\n" line endings
+    schema = pa.schema([(h, pa.string()) for h in headers])
+    options = pa_csv.WriteOptions(quoting_style="all_valid")
+    with path.open("wb") as f:
+        f.write("\ufeff".encode("utf-8"))
+        with pa_csv.CSVWriter(f, schema, write_options=options) as writer:
+            for batch in batches:
+                arrays = [pa.array(column, type=pa.string()) for column in zip(*batch)]
+                writer.write_batch(pa.record_batch(arrays, schema=schema))
+
+
 def process_shodan_json(json_file: Path, output_csv: Path) -> bool:
     """Process Shodan JSON file and convert to detection-compatible CSV"""
     
@@ -306,98 +414,123 @@ def process_shodan_json(json_file: Path, output_csv: Path) -> bool:
     
     print(f"[INFO] Reading: {json_file.name}")
     
-    # Try to detect format: standard JSON or JSONL
-    try:
-        content = json_file.read_text(encoding="utf-8")
-        data = json.loads(content)
+    # Try to detect format: JSONL (streamed line by line), standard JSON or JSON array
+    if looks_like_jsonl(json_file):
+        matches = iter_shodan_jsonl(json_file)
+        print(f"[INFO] Format: JSONL")
+    else:
+        try:
+            data = loads(json_file.read_bytes())
+            
+            if isinstance(data, dict) and "matches" in data:
+                matches = data.get("matches", [])
+                print(f"[INFO] Format: Standard Shodan JSON")
+            elif isinstance(data, list):
+                matches = data
+                print(f"[INFO] Format: JSON array")
+            else:
+                print(f"[ERROR] Unexpected JSON structure")
+                return False
         
-        if isinstance(data, dict) and "matches" in data:
-            matches = data.get("matches", [])
-            print(f"[INFO] Format: Standard Shodan JSON")
-        elif isinstance(data, list):
-            matches = data
-            print(f"[INFO] Format: JSON array")
-        else:
-            print(f"[ERROR] Unexpected JSON structure")
-            return False
-    
-    except json.JSONDecodeError:
-        # Try JSONL format
-        print(f"[INFO] Trying JSONL format...")
-        matches = []
-        with open(json_file, 'r', encoding='utf-8') as f:
-            for line_num, line in enumerate(f, 1):
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    record = json.loads(line)
-                    matches.append(record)
-                except json.JSONDecodeError as err:
-                    print(f"[WARNING] Skipped invalid JSON at line {line_num}")
-                    continue
+        except json.JSONDecodeError:
+            # e.g. JSONL whose first line is damaged
+            print(f"[INFO] Trying JSONL format...")
+            matches = iter_shodan_jsonl(json_file)
+            print(f"[INFO] Format: JSONL")
         
-        print(f"[INFO] Format: JSONL")
-    
-    if not matches:
-        print(f"[ERROR] No records found")
-        return False
+        if isinstance(matches, list):
+            if not matches:
+                print(f"[ERROR] No records found")
+                return False
+            
+            print(f"[INFO] Found {len(matches)} records")
     
-    print(f"[INFO] Found {len(matches)} records")
     print(f"[INFO] Converting to detection format...")
     
-    all_rows = []
-    all_headers = set()
-    
-    for idx, match in enumerate(matches, start=1):
-        if not isinstance(match, dict):
-            continue
-        
-        row = convert_shodan_to_detection_format(match)
-        
-        # Add metadata
-        row["source_file"] = json_file.name
-        row["record_index"] = str(idx)
-        
-        all_rows.append(row)
-        all_headers.update(row.keys())
+    # Converted rows are spooled to a temp file one block at a time (the header union is only known
+    # at the end), so peak memory is one block of rows instead of the whole dataset
+    spool = tempfile.TemporaryFile()
+    row_count = 0
+    # Column positions in first-seen order; rows are spooled as lists indexed by it
+    header_index: dict[str, int] = {}
+    source_file = json_file.name
+    
+    # Index before filtering so record_index still counts every input record
+    records = ((idx, match) for idx, match in enumerate(matches, start=1) if isinstance(match, dict))
+    
+    # Streamed JSONL has no length up front: the first block tells us whether the input is small
+    # (a short block is all there is) or at least a full block, and the pool is sized from that
+    block = list(itertools.islice(records, POOL_BLOCK_RECORDS))
+    expected = len(matches) if isinstance(matches, list) else len(block)
+    workers = min(os.cpu_count() or 1, -(-expected // MIN_RECORDS_PER_WORKER))
+    
+    with contextlib.ExitStack() as stack:
+        if workers > 1:
+            # Records are independent; map() keeps their order within each block
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+            def convert_block(block):
+                return pool.map(convert_shodan_to_detection_format, block, chunksize=POOL_CHUNKSIZE)
+        else:
+            def convert_block(block):
+                return map(convert_shodan_to_detection_format, block)
         
-        if idx % 100 == 0:
-            print(f"[STATUS] Processed {idx}/{len(matches)}...", end='\r')
+        while block:
+            rows = []
+            for (idx, _), row in zip(block, convert_block([match for _, match in block])):
+                # Add metadata
+                row["source_file"] = source_file
+                row["record_index"] = str(idx)
+                
+                values = [""] * len(header_index)
+                for key, value in row.items():
+                    pos = header_index.get(key)
+                    if pos is None:
+                        # New column: it takes the next position, which is the end of this row
+                        header_index[key] = len(values)
+                        values.append(value)
+                    else:
+                        values[pos] = value
+                rows.append(values)
+                
+                if idx % 100 == 0:
+                    print(f"[STATUS] Processed {idx}...", end='\r')
+            
+            pickle.dump(rows, spool, protocol=pickle.HIGHEST_PROTOCOL)
+            row_count += len(rows)
+            block = list(itertools.islice(records, POOL_BLOCK_RECORDS))
     
     print()
     
-    if not all_rows:
+    if not row_count:
+        spool.close()
         print("[ERROR] No rows collected")
         return False
     
-    # Sort headers
-    headers = sorted(all_headers)
+    # Sort headers; reorder maps a first-seen-order row onto sorted columns
+    # (there are always at least two columns, so itemgetter returns a tuple)
+    headers = sorted(header_index)
+    reorder = operator.itemgetter(*(header_index[h] for h in headers))
     
-    print(f"[INFO] Total rows: {len(all_rows)}")
+    print(f"[INFO] Total rows: {row_count}")
     print(f"[INFO] Total columns: {len(headers)}")
     print(f"[INFO] Writing CSV: {output_csv}")
     
     # Write CSV
     try:
-        with output_csv.open("w", newline="", encoding="utf-8-sig") as f:
-            writer = csv.DictWriter(
-                f,
-                fieldnames=headers,
-                quoting=csv.QUOTE_ALL,
-                lineterminator="\n"
-            )
-            writer.writeheader()
-            
-            for row in all_rows:
-                writer.writerow({h: row.get(h, "") for h in headers})
+        if PYARROW_AVAILABLE:
+            write_csv_arrow(output_csv, headers, iter_spooled_batches(spool, reorder, len(headers), ARROW_BATCH_ROWS))
+        else:
+            write_csv_stdlib(output_csv, headers, iter_spooled_batches(spool, reorder, len(headers), WRITE_BATCH_ROWS))
         
-        print(f"[SUCCESS] Wrote {len(all_rows)} rows")
+        print(f"[SUCCESS] Wrote {row_count} rows")
         return True
     
     except Exception as e:
         print(f"[ERROR] Failed to write CSV: {e}")
         return False
+    
+    finally:
+        spool.close()
 
 
 # ============================================================
@@ -27,6 +27,9 @@ FINAL_OUT = OUT_DIR / ".6_modat_data_validation.json"
 TMP_OUT = OUT_DIR / ".6_tmp_modat_data_validation.json"
 LOG_DIR = Path("./logs")
 
+# Keep-alive session: all pages go over one pooled HTTPS connection instead of a new handshake each
+SESSION = requests.Session()
+
 # =========================
 # HELPERS
 # =========================
@@ -53,7 +56,7 @@ def extract_results(data: dict) -> list:
 def post_page(headers: dict, query: str, page: int) -> dict | None:
     payload = {"query": query, "page": page, "page_size": PAGE_SIZE}
     for attempt in range(1, MAX_RETRIES + 1):
-        r = requests.post(API_URL, json=payload, headers=headers, timeout=60)
+        r = SESSION.post(API_URL, json=payload, headers=headers, timeout=60)
         if r.status_code == 200:
             try:
                 return r.json()
@@ -2,10 +2,34 @@
 
 from __future__ import annotations
 
+import contextlib
 import csv
 import json
+import operator
+import os
+import pickle
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+# Optional fast JSON backend; the stdlib json module is used when orjson is missing.
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Export files are parsed from bytes with whichever backend is available
+loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+
+# Optional: pyarrow writes the combined CSV (quoting in C++); csv.writer otherwise.
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
 # ============================================================
 # CONFIGURATION - FILL IN YOUR FILENAMES HERE
 # ============================================================
@@ -20,6 +44,13 @@ INPUT_FILES = [
 
 OUTPUT_CSV = OUTPUT_DIR / "combined_output.csv"
 
+WRITE_BATCH_ROWS = 500  # rows per csv writerows() call
+ARROW_BATCH_ROWS = 8192  # rows per RecordBatch on the pyarrow path
+
+# Files with many records are converted on a process pool (rows come back in input order)
+MIN_RECORDS_PER_WORKER = 2000
+POOL_CHUNKSIZE = 256
+
 
 # ============================================================
 # UTILITIES
@@ -27,70 +58,95 @@ OUTPUT_CSV = OUTPUT_DIR / "combined_output.csv"
 
 def clean_for_csv(value) -> str:
     """Clean value for CSV output"""
-    if value is None:
+    if type(value) is str:
+        text = value
+    elif value is None:
         return ""
-    if isinstance(value, bool):
+    elif isinstance(value, bool):
         return "true" if value else "false"
-    if isinstance(value, (int, float)):
+    elif isinstance(value, (int, float)):
         return str(value)
-
-    text = str(value)
-    # Normalize whitespace
-    text = text.replace("\r\n", " ").replace("\n", " ").replace("\r", " ").replace("\t", " ")
+    else:
+        text = str(value)
+
+    # Normalize whitespace; each replace only runs when its character occurs
+    if "\r" in text:
+        text = text.replace("\r\n", " ").replace("\r", " ")
+    if "\n" in text:
+        text = text.replace("\n", " ")
+    if "\t" in text:
+        text = text.replace("\t", " ")
     text = text.strip().strip('"').strip("'")
     return text
 
 
+# Shared encoder for JSON-valued cells (json.dumps(..., sort_keys=True) constructs one per call)
+_encode_json_sorted = json.JSONEncoder(ensure_ascii=False, sort_keys=True).encode
+
+
 def dict_to_clean_string(obj) -> str:
     """Convert dict/list to JSON string for CSV"""
     try:
-        return clean_for_csv(json.dumps(obj, ensure_ascii=False, sort_keys=True))
+        return clean_for_csv(_encode_json_sorted(obj))
     except Exception:
         return clean_for_csv(str(obj))
 
 
 def flatten(obj, parent_key: str = "", sep: str = ".") -> dict[str, str]:
     """Flatten nested JSON structure with dot notation"""
+    # Iterative depth-first walk writing into one dict. Children are pushed in reverse so they are
+    # visited (and overwrite each other) in the same order as a recursive walk would.
     items: dict[str, str] = {}
+    stack = [(obj, parent_key)]
+    pop, push_all = stack.pop, stack.extend
+    clean = clean_for_csv
+
+    while stack:
+        cur, pk = pop()
+
+        if isinstance(cur, dict):
+            children = []
+            for k, v in cur.items():
+                # Skip additionalProp fields (API schema artifacts)
+                if k.startswith("additionalProp"):
+                    continue
+
+                new_key = f"{pk}{sep}{k}" if pk else str(k)
+
+                # Skip raw certificate data (too large)
+                low = new_key.lower()
+                if "raw" in low and "cert" in low:
+                    continue
+
+                children.append((v, new_key))
+            children.reverse()
+            push_all(children)
+            continue
 
-    if isinstance(obj, dict):
-        for k, v in obj.items():
-            new_key = f"{parent_key}{sep}{k}" if parent_key else str(k)
+        if isinstance(cur, list):
+            # Add count for lists
+            if pk:
+                items[pk + "_count"] = str(len(cur))
 
-            # Skip additionalProp fields (API schema artifacts)
-            if k.startswith("additionalProp"):
+            # Empty list
+            if not cur:
+                items[pk] = ""
+                items[pk + "_count"] = "0"
                 continue
 
-            # Skip raw certificate data (too large)
-            if "raw" in new_key.lower() and "cert" in new_key.lower():
+            # List of primitives: join with semicolon
+            if all(not isinstance(x, (dict, list)) for x in cur):
+                vals = [str(x) for x in cur if x is not None]
+                items[pk] = clean(";".join(vals))
+                items[pk + "_count"] = str(len(vals))
                 continue
 
-            items.update(flatten(v, new_key, sep=sep))
-        return items
-
-    if isinstance(obj, list):
-        # Add count for lists
-        if parent_key:
-            items[parent_key + "_count"] = str(len(obj))
-
-        # Empty list
-        if not obj:
-            items[parent_key] = ""
-            items[parent_key + "_count"] = "0"
-            return items
-
-        # List of primitives: join with semicolon
-        if all(not isinstance(x, (dict, list)) for x in obj):
-            vals = [str(x) for x in obj if x is not None]
-            items[parent_key] = clean_for_csv(";".join(vals))
-            items[parent_key + "_count"] = str(len(vals))
-            return items
+            # List with complex objects: stringify as JSON
+            items[pk] = dict_to_clean_string(cur)
+            continue
 
-        # List with complex objects: stringify as JSON
-        items[parent_key] = dict_to_clean_string(obj)
-        return items
+        items[pk] = clean(cur)
 
-    items[parent_key] = clean_for_csv(obj)
     return items
 
 
@@ -98,6 +154,9 @@ def flatten(obj, parent_key: str = "", sep: str = ".") -> dict[str, str]:
 # MODAT FORMAT SPECIFIC PROCESSING
 # ============================================================
 
+# Top-level record keys extract_modat_record maps explicitly (everything else is flattened)
+HANDLED_KEYS = frozenset({"ip", "geo", "asn", "fqdns", "is_anycast", "tags", "cves", "service", "services"})
+
 def extract_modat_record(item: dict) -> dict[str, str]:
     """
     Extract and flatten a single record from Modat format.
@@ -229,9 +288,8 @@ def extract_modat_record(item: dict) -> dict[str, str]:
                 row["services.transports"] = ";".join(sorted(all_transports))
 
     # Flatten any other top-level fields not already handled
-    handled_keys = {"ip", "geo", "asn", "fqdns", "is_anycast", "tags", "cves", "service", "services"}
     for key, value in item.items():
-        if key not in handled_keys and not key.startswith("additionalProp"):
+        if key not in HANDLED_KEYS and not key.startswith("additionalProp"):
             if isinstance(value, (dict, list)):
                 flattened = flatten(value, key)
                 row.update(flattened)
@@ -261,7 +319,7 @@ def process_json_file(json_file: Path) -> list[dict[str, str]]:
     print(f"[INFO] Processing: {json_file.name}")
 
     try:
-        data = json.loads(json_file.read_text(encoding="utf-8"))
+        data = loads(json_file.read_bytes())
     except Exception as e:
         print(f"[ERROR] Failed to read {json_file.name}: {e}")
         return []
@@ -333,33 +391,72 @@ def process_json_file(json_file: Path) -> list[dict[str, str]]:
     rows = []
     source_file = json_file.name
 
-    for idx, item in enumerate(records, start=1):
-        if not isinstance(item, dict):
-            continue
+    # Index before filtering so record_index still counts every input record
+    indexed = [(idx, item) for idx, item in enumerate(records, start=1) if isinstance(item, dict)]
+    workers = min(os.cpu_count() or 1, -(-len(indexed) // MIN_RECORDS_PER_WORKER))
 
-        # Extract and flatten the record
-        row = extract_modat_record(item)
-
-        # Add source metadata
-        row["source_file"] = source_file
-        row["source_format"] = "export" if "results" in data else "api"
-        row["record_index"] = str(idx)
-
-        # Add format-specific metadata
-        if "results" in data:
-            row["export.total_pages"] = str(metadata.get("total_pages", ""))
-            row["export.results_count"] = str(metadata.get("results_count", ""))
-        elif "results_by_page" in data:
-            row["export.total_pages"] = str(metadata.get("total_pages", ""))
-            row["export.results_count"] = str(metadata.get("results_count", ""))
+    # Extract and flatten the records
+    with contextlib.ExitStack() as stack:
+        if workers > 1:
+            pool = stack.enter_context(ProcessPoolExecutor(max_workers=workers))
+            converted = pool.map(extract_modat_record, [item for _, item in indexed], chunksize=POOL_CHUNKSIZE)
         else:
-            row["api.page_nr"] = str(metadata.get("page_nr", ""))
+            converted = map(extract_modat_record, (item for _, item in indexed))
+
+        for (idx, _), row in zip(indexed, converted):
+            # Add source metadata
+            row["source_file"] = source_file
+            row["source_format"] = "export" if "results" in data else "api"
+            row["record_index"] = str(idx)
+
+            # Add format-specific metadata
+            if "results" in data:
+                row["export.total_pages"] = str(metadata.get("total_pages", ""))
+                row["export.results_count"] = str(metadata.get("results_count", ""))
+            elif "results_by_page" in data:
+                row["export.total_pages"] = str(metadata.get("total_pages", ""))
+                row["export.results_count"] = str(metadata.get("results_count", ""))
+            else:
+                row["api.page_nr"] = str(metadata.get("page_nr", ""))
 
-        rows.append(row)
+            rows.append(row)
 
     return rows
 
 
+def iter_spooled_batches(spool, reorder, width: int, batch_rows: int):
+    """Spooled rows, padded to width and put in sorted header order, batch_rows per batch."""
+    padding = [""] * width
+    spool.seek(0)
+    while True:
+        try:
+            rows = pickle.load(spool)
+        except EOFError:
+            return
+        for start in range(0, len(rows), batch_rows):
+            yield [reorder(row + padding[len(row):]) for row in rows[start:start + batch_rows]]
+
+
+def write_csv_stdlib(path: Path, headers: list[str], batches) -> None:
+    with path.open("w", newline="", encoding="utf-8-sig") as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL, lineterminator="\n")
+        writer.writerow(headers)
+        for batch in batches:
+            writer.writerows(batch)
+
+
+def write_csv_arrow(path: Path, headers: list[str], batches) -> None:
+    # Output is identical to write_csv_stdlib (BOM, QUOTE_ALL, "\n"); the BOM is written by hand
+    schema = pa.schema([(h, pa.string()) for h in headers])
+    options = pa_csv.WriteOptions(quoting_style="all_valid")
+    with path.open("wb") as f:
+        f.write("\ufeff".encode("utf-8"))
+        with pa_csv.CSVWriter(f, schema, write_options=options) as writer:
+            for batch in batches:
+                arrays = [pa.array(column, type=pa.string()) for column in zip(*batch)]
+                writer.write_batch(pa.record_batch(arrays, schema=schema))
+
+
 def process_multiple_files_to_csv(input_files: list[str], output_csv: Path) -> bool:
     """Process multiple JSON files and combine into single CSV"""
 
@@ -373,8 +470,12 @@ def process_multiple_files_to_csv(input_files: list[str], output_csv: Path) -> b
     print("=" * 70)
     print()
 
-    all_rows: list[dict[str, str]] = []
-    all_headers: set[str] = set()
+    # Each file's rows are spooled to a temp file right away (headers are only final after the
+    # last file), so only one file's rows are held in memory at a time
+    spool = tempfile.TemporaryFile()
+    row_count = 0
+    # Header -> column position, assigned as headers are first seen across all files
+    header_index: dict[str, int] = {}
 
     # Process each file
     for filename in input_files:
@@ -382,45 +483,55 @@ def process_multiple_files_to_csv(input_files: list[str], output_csv: Path) -> b
         rows = process_json_file(json_path)
 
         if rows:
-            all_rows.extend(rows)
-            # Collect all unique headers
+            # Store each row as a list of values by column position
+            positional = []
             for row in rows:
-                all_headers.update(row.keys())
+                values = [""] * len(header_index)
+                for key, value in row.items():
+                    pos = header_index.get(key)
+                    if pos is None:
+                        header_index[key] = len(values)
+                        values.append(value)
+                    else:
+                        values[pos] = value
+                positional.append(values)
+            pickle.dump(positional, spool, protocol=pickle.HIGHEST_PROTOCOL)
+            row_count += len(rows)
 
         print()
 
-    if not all_rows:
+    if not row_count:
+        spool.close()
         print("[ERROR] No data collected from any file")
         return False
 
-    # Sort headers alphabetically
-    headers = sorted(all_headers)
+    # Sort headers alphabetically; every row carries the source/record metadata
+    # columns, so there are always several positions and itemgetter yields a tuple
+    headers = sorted(header_index)
+    reorder = operator.itemgetter(*(header_index[h] for h in headers))
 
-    print(f"[INFO] Total rows collected: {len(all_rows)}")
+    print(f"[INFO] Total rows collected: {row_count}")
     print(f"[INFO] Total columns: {len(headers)}")
     print(f"[INFO] Writing CSV: {output_csv}")
 
     # Write CSV
     try:
-        with output_csv.open("w", newline="", encoding="utf-8-sig") as f:
-            writer = csv.DictWriter(
-                f,
-                fieldnames=headers,
-                quoting=csv.QUOTE_ALL,
-                lineterminator="\n"
-            )
-            writer.writeheader()
-
-            for row in all_rows:
-                writer.writerow({h: row.get(h, "") for h in headers})
-
-        print(f"[SUCCESS] Wrote {len(all_rows)} rows to {output_csv}")
+        # Rows from earlier files lack the later columns; iter_spooled_batches pads them
+        if PYARROW_AVAILABLE:
+            write_csv_arrow(output_csv, headers, iter_spooled_batches(spool, reorder, len(headers), ARROW_BATCH_ROWS))
+        else:
+            write_csv_stdlib(output_csv, headers, iter_spooled_batches(spool, reorder, len(headers), WRITE_BATCH_ROWS))
+
+        print(f"[SUCCESS] Wrote {row_count} rows to {output_csv}")
         return True
 
     except Exception as e:
         print(f"[ERROR] Failed to write CSV: {e}")
         return False
 
+    finally:
+        spool.close()
+
 
 # ============================================================
 # MAIN